@@ -36,7 +36,7 @@ from stats_viz import (
     generate_server_cpu_chart, generate_server_memory_chart,
     generate_server_disk_chart, generate_server_combined_chart,
     generate_server_network_chart,
-    format_size
+    chart_extension, format_size
 )
 from server_monitor import ServerMonitor, get_uptime_info
 
@@ -291,8 +291,7 @@ async def full_sync_server() -> None:
     if not _db:
         return
         
-    clients = await _db.get_all_clients()
-    clients_dicts = [{"public_key": c.public_key, "address": c.address} for c in clients]
+    clients_dicts = await _db.get_active_peer_config()
     
     # 1. Update config file on disk
     _vpn.update_server_config_file(clients_dicts)
@@ -535,16 +534,13 @@ async def process_delete_callback(callback: CallbackQuery):
         return
         
     client_name = callback.data.split(":")[1]
-    
-    # Check existance
-    if not await _db.client_exists(client_name):
-        await callback.answer("Client already deleted", show_alert=True)
-        await callback.message.delete()
-        return
 
     try:
-        # Delete from DB
-        await _db.delete_client(client_name)
+        # Delete from DB (returns False if the client is already gone)
+        if not await _db.delete_client(client_name):
+            await callback.answer("Client already deleted", show_alert=True)
+            await callback.message.delete()
+            return
         
         # FULL SYNC (Remove from config and reload interface)
         await full_sync_server()
@@ -796,7 +792,7 @@ async def process_stats_view(callback: CallbackQuery, state: FSMContext):
             return
 
         if chart_img:
-            file = BufferedInputFile(chart_img, filename="chart.png")
+            file = BufferedInputFile(chart_img, filename=f"chart{chart_extension()}")
             await callback.message.answer_photo(
                 file, 
                 caption=caption,
@@ -877,7 +873,7 @@ async def process_stats_end_date(message: Message, state: FSMContext) -> None:
         chart_img = generate_series_chart(traffic_data, f"Traffic: {start_date} to {end_date}\n{target_name}")
         
         if chart_img:
-             file = BufferedInputFile(chart_img, filename="custom_stats.png")
+             file = BufferedInputFile(chart_img, filename=f"custom_stats{chart_extension()}")
              await message.answer_photo(
                  file, 
                  caption=f"📈 **Custom Range Report**\nPeriod: `{start_date}` - `{end_date}`\nTarget: `{target_name}`",
@@ -1019,7 +1015,7 @@ async def process_server_view(callback: CallbackQuery, state: FSMContext):
             return
 
         if chart_img:
-            file = BufferedInputFile(chart_img, filename="server_chart.png")
+            file = BufferedInputFile(chart_img, filename=f"server_chart{chart_extension()}")
             await callback.message.answer_photo(
                 file,
                 caption=caption,
@@ -1070,7 +1066,7 @@ async def process_server_chart(callback: CallbackQuery):
             return
 
         if chart_img:
-            file = BufferedInputFile(chart_img, filename="server_chart.png")
+            file = BufferedInputFile(chart_img, filename=f"server_chart{chart_extension()}")
             await callback.message.answer_photo(
                 file,
                 caption=caption,
@@ -1133,11 +1129,11 @@ async def process_srv_stats_end_date(message: Message, state: FSMContext) -> Non
     await message.answer("⏳ Generating chart...")
 
     try:
-        stats_data = await _db.get_server_stats_series(start_date=start_date, end_date=end_date)
+        stats_data = await _db.get_server_stats_range(start_date, end_date)
         chart_img = generate_server_combined_chart(stats_data, f"Server Resources: {start_date} to {end_date}")
 
         if chart_img:
-            file = BufferedInputFile(chart_img, filename="server_custom_stats.png")
+            file = BufferedInputFile(chart_img, filename=f"server_custom_stats{chart_extension()}")
             await message.answer_photo(
                 file,
                 caption=f"📈 <b>Server Resources</b>\nPeriod: <code>{start_date}</code> - <code>{end_date}</code>",
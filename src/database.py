@@ -3,26 +3,181 @@ Database module for AmneziaWG VPN Manager.
 Uses SQLite with aiosqlite for async operations.
 """
 
+import asyncio
+import json
+import sqlite3
+import time
 import aiosqlite
 from dataclasses import dataclass
-from datetime import datetime
+from datetime import datetime, timezone
 from pathlib import Path
 from typing import Optional
 
-
-@dataclass
+try:
+    import orjson
+except ImportError:  # optional, falls back to the stdlib parser
+    orjson = None
+
+
+# Client addresses are always VPN_SUBNET_PREFIX + octet + "/32"
+VPN_SUBNET_PREFIX = "10.8.0."
+
+# Rows removed per transaction by retention cleanup
+_DELETE_BATCH = 5000
+
+# Per-connection settings, applied to both the shared aiosqlite connection
+# and the collector's write connection (none of these persist in the file)
+_CONNECTION_PRAGMAS = (
+    # In WAL mode NORMAL only fsyncs on checkpoint, not every commit
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",  # 256 MB
+    "PRAGMA cache_size=-65536",  # 64 MB
+    # Fold WAL back into the main file every ~400 pages (default 1000)
+    "PRAGMA wal_autocheckpoint=400",
+)
+
+# Column definitions shared by CREATE TABLE and table rebuild migrations
+_CLIENTS_COLUMNS = """(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT UNIQUE NOT NULL,
+    public_key TEXT UNIQUE NOT NULL,
+    private_key TEXT NOT NULL,
+    ip_octet INTEGER UNIQUE NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    is_active BOOLEAN DEFAULT 1,
+    current_session_id INTEGER
+)"""
+
+# Timestamps below are INTEGER unix seconds (UTC).
+# Per-client rows go away with their client via ON DELETE CASCADE.
+_TRAFFIC_HISTORY_COLUMNS = """(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    client_id INTEGER NOT NULL,
+    bytes_received INTEGER NOT NULL,
+    bytes_sent INTEGER NOT NULL,
+    recorded_at INTEGER NOT NULL DEFAULT (unixepoch()),
+    FOREIGN KEY (client_id) REFERENCES clients(id) ON DELETE CASCADE
+)"""
+
+_TRAFFIC_COUNTERS_COLUMNS = """(
+    client_id INTEGER PRIMARY KEY,
+    last_bytes_received INTEGER DEFAULT 0,
+    last_bytes_sent INTEGER DEFAULT 0,
+    updated_at INTEGER NOT NULL DEFAULT (unixepoch()),
+    FOREIGN KEY (client_id) REFERENCES clients(id) ON DELETE CASCADE
+) WITHOUT ROWID"""
+
+_SESSIONS_COLUMNS = """(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    client_id INTEGER NOT NULL,
+    start_at INTEGER NOT NULL,
+    end_at INTEGER,
+    is_active BOOLEAN DEFAULT 1,
+    FOREIGN KEY (client_id) REFERENCES clients(id) ON DELETE CASCADE
+)"""
+
+_TRAFFIC_HISTORY_HOURLY_COLUMNS = """(
+    client_id INTEGER NOT NULL,
+    hour_ts INTEGER NOT NULL,
+    rx INTEGER NOT NULL DEFAULT 0,
+    tx INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (client_id, hour_ts),
+    FOREIGN KEY (client_id) REFERENCES clients(id) ON DELETE CASCADE
+) WITHOUT ROWID"""
+
+_SERVER_STATS_COLUMNS = """(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp INTEGER NOT NULL DEFAULT (unixepoch()),
+    cpu_percent REAL NOT NULL,
+    cpu_count INTEGER NOT NULL,
+    mem_total INTEGER NOT NULL,
+    mem_used INTEGER NOT NULL,
+    mem_percent REAL NOT NULL,
+    disk_total INTEGER NOT NULL,
+    disk_used INTEGER NOT NULL,
+    disk_percent REAL NOT NULL,
+    net_bytes_sent INTEGER NOT NULL,
+    net_bytes_recv INTEGER NOT NULL,
+    load_1m REAL,
+    load_5m REAL,
+    load_15m REAL
+)"""
+
+_SERVER_EVENTS_COLUMNS = """(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    event_type TEXT NOT NULL,
+    event_time INTEGER NOT NULL DEFAULT (unixepoch()),
+    details TEXT
+)"""
+
+
+def _octet_from_address(address: str) -> int:
+    """Extract last IP octet from "10.8.0.X/32"."""
+    return int(address.split("/")[0].rsplit(".", 1)[1])
+
+
+def _epoch_cutoff(days: int = 0, minutes: int = 0) -> int:
+    """Unix time N days/minutes ago."""
+    return int(time.time()) - days * 86400 - minutes * 60
+
+
+def _date_epoch(date: str, end_of_day: bool = False, utc: bool = False) -> int:
+    """Unix time of midnight (or 23:59:59) on a 'YYYY-MM-DD' date, local or UTC."""
+    day = datetime.strptime(date, "%Y-%m-%d")
+    if utc:
+        day = day.replace(tzinfo=timezone.utc)
+    ts = int(day.timestamp())
+    return ts + 86399 if end_of_day else ts
+
+
+def _json_dumps(value) -> str:
+    """Serialize to compact JSON text."""
+    if orjson is not None:
+        return orjson.dumps(value).decode()
+    return json.dumps(value, separators=(',', ':'))
+
+
+# orjson.JSONDecodeError subclasses json.JSONDecodeError
+_json_loads = orjson.loads if orjson is not None else json.loads
+
+
+def _counter_delta(current: int, last: int) -> int:
+    """Delta between counter readings; a lower reading means the counter was reset."""
+    return current - last if current >= last else current
+
+
+async def _fetch_dicts(cursor: aiosqlite.Cursor) -> list[dict]:
+    """Fetch all rows as dicts, reading column names once per statement."""
+    cursor.row_factory = None
+    rows = await cursor.fetchall()
+    names = [column[0] for column in cursor.description]
+    return [dict(zip(names, row)) for row in rows]
+
+
+@dataclass(slots=True)
 class Client:
     """VPN client data model."""
     id: int
     name: str
     public_key: str
     private_key: str
-    address: str  # e.g., "10.8.0.2/32"
-    created_at: datetime
+    ip_octet: int  # e.g., 2 for "10.8.0.2/32"
+    created_ts: int  # unix seconds
     is_active: bool = True
 
+    @property
+    def address(self) -> str:
+        """Client address in CIDR form, e.g. "10.8.0.2/32"."""
+        return f"{VPN_SUBNET_PREFIX}{self.ip_octet}/32"
+
+    @property
+    def created_at(self) -> datetime:
+        """Creation time (local), only built when asked for."""
+        return datetime.fromtimestamp(self.created_ts)
 
-@dataclass
+
+@dataclass(slots=True)
 class TrafficRecord:
     """Traffic history record."""
     id: int
@@ -32,6 +187,160 @@ class TrafficRecord:
     recorded_at: datetime
 
 
+# Column order matches _client_from_row. created_at is stored as UTC text
+# and handed over as unix seconds
+_CLIENT_SELECT = (
+    "SELECT id, name, public_key, private_key, ip_octet, "
+    "unixepoch(created_at), is_active FROM clients"
+)
+
+
+# Hot statements are kept as constants so each call passes the identical
+# string and hits the sqlite3 prepared statement cache
+_SQL_GET_CLIENT_BY_NAME = f"{_CLIENT_SELECT} WHERE name = ?"
+_SQL_GET_CLIENT_BY_PUBLIC_KEY = f"{_CLIENT_SELECT} WHERE public_key = ?"
+_SQL_CLIENT_EXISTS = "SELECT EXISTS(SELECT 1 FROM clients WHERE name = ?)"
+_SQL_GET_ACTIVE_CLIENTS = f"{_CLIENT_SELECT} WHERE is_active = 1 ORDER BY id"
+
+# IDs are bound as one JSON array so the text doesn't vary with the peer count
+_SQL_GET_LAST_COUNTERS = """
+    SELECT client_id, last_bytes_received, last_bytes_sent
+    FROM traffic_counters
+    WHERE client_id IN (SELECT value FROM json_each(?))
+"""
+
+# Updates in place instead of delete+insert
+_SQL_SET_COUNTERS = """
+    INSERT INTO traffic_counters
+    (client_id, last_bytes_received, last_bytes_sent, updated_at)
+    VALUES (?, ?, ?, unixepoch())
+    ON CONFLICT(client_id) DO UPDATE SET
+        last_bytes_received = excluded.last_bytes_received,
+        last_bytes_sent = excluded.last_bytes_sent,
+        updated_at = excluded.updated_at
+"""
+_SQL_INSERT_HISTORY = """
+    INSERT INTO traffic_history (client_id, bytes_received, bytes_sent)
+    VALUES (?, ?, ?)
+"""
+
+# Report queries come in pairs (all clients / one client) so the SQL text
+# is fixed and each variant stays in the statement cache
+_TRAFFIC_SERIES_SELECT = """
+    SELECT
+        strftime('%Y-%m-%d %H:00:00', hour_ts, 'unixepoch') as ts,
+        SUM(rx) as rx,
+        SUM(tx) as tx
+    FROM traffic_history_hourly
+"""
+_SQL_TRAFFIC_SERIES = f"""{_TRAFFIC_SERIES_SELECT}
+    WHERE hour_ts >= ?
+    GROUP BY hour_ts ORDER BY hour_ts
+"""
+_SQL_TRAFFIC_SERIES_CLIENT = f"""{_TRAFFIC_SERIES_SELECT}
+    WHERE hour_ts >= ? AND client_id = ?
+    GROUP BY hour_ts ORDER BY hour_ts
+"""
+_SQL_TRAFFIC_SERIES_RANGE = f"""{_TRAFFIC_SERIES_SELECT}
+    WHERE hour_ts BETWEEN ? AND ?
+    GROUP BY hour_ts ORDER BY hour_ts
+"""
+_SQL_TRAFFIC_SERIES_RANGE_CLIENT = f"""{_TRAFFIC_SERIES_SELECT}
+    WHERE hour_ts BETWEEN ? AND ? AND client_id = ?
+    GROUP BY hour_ts ORDER BY hour_ts
+"""
+
+# Hour of day (UTC) straight from the epoch, no per-row strftime
+_HOURLY_ACTIVITY_SELECT = """
+    SELECT
+        hour_ts / 3600 % 24 as hour,
+        AVG(rx + tx) as avg_bytes,
+        SUM(rx + tx) as total_bytes
+    FROM traffic_history_hourly
+"""
+_SQL_HOURLY_ACTIVITY = f"{_HOURLY_ACTIVITY_SELECT} GROUP BY hour ORDER BY hour"
+_SQL_HOURLY_ACTIVITY_CLIENT = (
+    f"{_HOURLY_ACTIVITY_SELECT} WHERE client_id = ? GROUP BY hour ORDER BY hour"
+)
+
+# Same numbering as strftime %w; 1970-01-01 was a Thursday (4)
+_WEEKLY_ACTIVITY_SELECT = """
+    SELECT
+        (hour_ts / 86400 + 4) % 7 as weekday,
+        SUM(rx + tx) as total_bytes
+    FROM traffic_history_hourly
+"""
+_SQL_WEEKLY_ACTIVITY = f"{_WEEKLY_ACTIVITY_SELECT} GROUP BY weekday ORDER BY weekday"
+_SQL_WEEKLY_ACTIVITY_CLIENT = (
+    f"{_WEEKLY_ACTIVITY_SELECT} WHERE client_id = ? GROUP BY weekday ORDER BY weekday"
+)
+
+_MINUTE_SERIES_SELECT = """
+    SELECT
+        strftime('%Y-%m-%d %H:%M:00', recorded_at / 60 * 60, 'unixepoch') as ts,
+        SUM(bytes_received) as rx,
+        SUM(bytes_sent) as tx
+    FROM traffic_history
+"""
+_SQL_MINUTE_SERIES = f"""{_MINUTE_SERIES_SELECT}
+    WHERE recorded_at >= ?
+    GROUP BY recorded_at / 60 ORDER BY recorded_at / 60
+"""
+_SQL_MINUTE_SERIES_CLIENT = f"""{_MINUTE_SERIES_SELECT}
+    WHERE recorded_at >= ? AND client_id = ?
+    GROUP BY recorded_at / 60 ORDER BY recorded_at / 60
+"""
+
+# Session times are returned as local "YYYY-MM-DD HH:MM:SS" strings
+_SESSION_SELECT = """
+    SELECT id, client_id,
+        datetime(start_at, 'unixepoch', 'localtime') AS start_at,
+        datetime(end_at, 'unixepoch', 'localtime') AS end_at,
+        is_active
+    FROM sessions
+"""
+# clients.current_session_id points at the active session, so these
+# are primary key lookups
+_SQL_GET_ACTIVE_SESSION = (
+    f"{_SESSION_SELECT} WHERE id = (SELECT current_session_id FROM clients WHERE id = ?)"
+)
+_SQL_START_SESSION = "INSERT INTO sessions (client_id, start_at, is_active) VALUES (?, ?, 1)"
+_SQL_END_SESSION = """
+    UPDATE sessions SET end_at = ?, is_active = 0
+    WHERE id = (SELECT current_session_id FROM clients WHERE id = ?)
+"""
+_SQL_SET_CURRENT_SESSION = "UPDATE clients SET current_session_id = ? WHERE id = ?"
+
+
+# Sample times are returned as local "YYYY-MM-DD HH:MM:SS" strings
+_SERVER_STATS_SELECT = """
+    SELECT id,
+        datetime(timestamp, 'unixepoch', 'localtime') AS timestamp,
+        cpu_percent, cpu_count,
+        mem_total, mem_used, mem_percent,
+        disk_total, disk_used, disk_percent,
+        net_bytes_sent, net_bytes_recv,
+        load_1m, load_5m, load_15m
+    FROM server_stats
+"""
+_SQL_INSERT_SERVER_STATS = """
+    INSERT INTO server_stats (
+        timestamp, cpu_percent, cpu_count,
+        mem_total, mem_used, mem_percent,
+        disk_total, disk_used, disk_percent,
+        net_bytes_sent, net_bytes_recv,
+        load_1m, load_5m, load_15m
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+_SQL_INSERT_SERVER_EVENT = "INSERT INTO server_events (event_type, details) VALUES (?, ?)"
+
+
+def _client_from_row(row) -> Client:
+    """Build Client from a row selected with _CLIENT_SELECT."""
+    id_, name, public_key, private_key, ip_octet, created_ts, is_active = row
+    return Client(id_, name, public_key, private_key, ip_octet, created_ts, bool(is_active))
+
+
 class Database:
     """Async SQLite database handler."""
 
@@ -39,114 +348,455 @@ class Database:
         self.db_path = Path(db_path)
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
 
+        # In-memory view of allocated last octets (10.8.0.X), loaded in init()
+        self._used_octets: set[int] = set()
+        # Every octet below the hint is known to be in use
+        self._next_octet_hint: int = 2
+
+        # Single connection shared by all methods, opened in init()
+        self._db: Optional[aiosqlite.Connection] = None
+        # Synchronous connection for batch writes done in a worker thread
+        self._write_conn: Optional[sqlite3.Connection] = None
+        # Serializes writes so transactions don't interleave on the connection
+        self._lock = asyncio.Lock()
+
     async def init(self) -> None:
-        """Initialize database schema."""
-        async with aiosqlite.connect(self.db_path) as db:
-            # Clients table
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS clients (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT UNIQUE NOT NULL,
-                    public_key TEXT UNIQUE NOT NULL,
-                    private_key TEXT NOT NULL,
-                    address TEXT UNIQUE NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    is_active BOOLEAN DEFAULT 1
+        """Open the shared connection and initialize database schema."""
+        if self._db is None:
+            # Larger statement cache (default 128) keeps all queries prepared
+            self._db = await aiosqlite.connect(self.db_path, cached_statements=256)
+            # Set once for the connection; single-row lookups read Rows,
+            # list queries and positional lookups switch their cursor to tuples
+            self._db.row_factory = aiosqlite.Row
+        db = self._db
+
+        # Table rebuilds below drop and recreate child tables, which must not
+        # cascade; enforcement is switched on once the schema is in place
+        await db.execute("PRAGMA foreign_keys=OFF")
+
+        # WAL mode is persistent, stored in the database file header
+        await db.execute("PRAGMA journal_mode=WAL")
+        for pragma in _CONNECTION_PRAGMAS:
+            await db.execute(pragma)
+
+        # Clients table
+        await db.execute(f"CREATE TABLE IF NOT EXISTS clients {_CLIENTS_COLUMNS}")
+        await self._migrate_client_address(db)
+
+        # Traffic history table
+        await db.execute(f"CREATE TABLE IF NOT EXISTS traffic_history {_TRAFFIC_HISTORY_COLUMNS}")
+        await self._migrate_epoch(
+            db, "traffic_history", "recorded_at", _TRAFFIC_HISTORY_COLUMNS,
+            "id, client_id, bytes_received, bytes_sent, unixepoch(recorded_at)"
+        )
+
+        # Last known traffic counters (for delta calculation)
+        # WireGuard resets counters on restart, so we track last known values
+        await db.execute(f"CREATE TABLE IF NOT EXISTS traffic_counters {_TRAFFIC_COUNTERS_COLUMNS}")
+        await self._migrate_epoch(
+            db, "traffic_counters", "updated_at", _TRAFFIC_COUNTERS_COLUMNS,
+            "client_id, last_bytes_received, last_bytes_sent, "
+            "COALESCE(unixepoch(updated_at), unixepoch())"
+        )
+        await self._migrate_counters_without_rowid(db)
+        # Every new client starts with a zeroed counter row
+        await db.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_clients_counters
+            AFTER INSERT ON clients
+            BEGIN
+                INSERT OR IGNORE INTO traffic_counters (client_id, last_bytes_received, last_bytes_sent)
+                VALUES (NEW.id, 0, 0);
+            END
+        """)
+
+        # Sessions table (legacy rows hold local time, hence 'utc')
+        await db.execute(f"CREATE TABLE IF NOT EXISTS sessions {_SESSIONS_COLUMNS}")
+        await self._migrate_epoch(
+            db, "sessions", "start_at", _SESSIONS_COLUMNS,
+            "id, client_id, unixepoch(start_at, 'utc'), unixepoch(end_at, 'utc'), is_active"
+        )
+
+        for table, columns in (
+            ("traffic_history", _TRAFFIC_HISTORY_COLUMNS),
+            ("traffic_counters", _TRAFFIC_COUNTERS_COLUMNS),
+            ("sessions", _SESSIONS_COLUMNS),
+        ):
+            await self._migrate_cascade(db, table, columns)
+        await self._migrate_current_session(db)
+
+        # Covering indexes: per-client and whole-server aggregations are
+        # answered from the index without touching the table rows
+        await db.execute("DROP INDEX IF EXISTS idx_traffic_history_client")
+        await db.execute("DROP INDEX IF EXISTS idx_traffic_history_time")
+        await db.execute("""
+            CREATE INDEX IF NOT EXISTS idx_th_cov
+            ON traffic_history(client_id, recorded_at, bytes_received, bytes_sent)
+        """)
+        await db.execute("""
+            CREATE INDEX IF NOT EXISTS idx_th_time_cov
+            ON traffic_history(recorded_at, bytes_received, bytes_sent)
+        """)
+        await db.execute("""
+            CREATE INDEX IF NOT EXISTS idx_sessions_client
+            ON sessions(client_id)
+        """)
+        # Partial indexes only hold the rows the hot lookups filter on
+        await db.execute("""
+            CREATE INDEX IF NOT EXISTS idx_sessions_active
+            ON sessions(client_id) WHERE is_active = 1
+        """)
+        await db.execute("""
+            CREATE INDEX IF NOT EXISTS idx_clients_active
+            ON clients(id) WHERE is_active = 1
+        """)
+
+        # Hourly traffic rollup, kept in sync with traffic_history by trigger.
+        # Long-range reports read this instead of the raw history.
+        async with db.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'traffic_history_hourly'"
+        ) as cursor:
+            has_rollup = await cursor.fetchone() is not None
+        await db.execute(
+            f"CREATE TABLE IF NOT EXISTS traffic_history_hourly {_TRAFFIC_HISTORY_HOURLY_COLUMNS}"
+        )
+        await self._migrate_epoch(
+            db, "traffic_history_hourly", "hour_ts", _TRAFFIC_HISTORY_HOURLY_COLUMNS,
+            "client_id, unixepoch(hour_ts), rx, tx"
+        )
+        await self._migrate_cascade(db, "traffic_history_hourly", _TRAFFIC_HISTORY_HOURLY_COLUMNS)
+        # The primary key serves per-client ranges; whole-server time ranges
+        # are answered from this covering index
+        await db.execute("""
+            CREATE INDEX IF NOT EXISTS idx_thh_time_cov
+            ON traffic_history_hourly(hour_ts, rx, tx)
+        """)
+        await db.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_traffic_history_hourly
+            AFTER INSERT ON traffic_history
+            BEGIN
+                INSERT INTO traffic_history_hourly (client_id, hour_ts, rx, tx)
+                VALUES (
+                    NEW.client_id,
+                    NEW.recorded_at / 3600 * 3600,
+                    NEW.bytes_received,
+                    NEW.bytes_sent
                 )
-            """)
-
-            # Traffic history table
+                ON CONFLICT(client_id, hour_ts) DO UPDATE SET
+                    rx = rx + excluded.rx,
+                    tx = tx + excluded.tx;
+            END
+        """)
+        if not has_rollup:
+            # Backfill from history recorded before the rollup existed
             await db.execute("""
-                CREATE TABLE IF NOT EXISTS traffic_history (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    client_id INTEGER NOT NULL,
-                    bytes_received INTEGER NOT NULL,
-                    bytes_sent INTEGER NOT NULL,
-                    recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (client_id) REFERENCES clients(id)
-                )
+                INSERT INTO traffic_history_hourly (client_id, hour_ts, rx, tx)
+                SELECT
+                    client_id,
+                    recorded_at / 3600 * 3600 AS hour_ts,
+                    SUM(bytes_received),
+                    SUM(bytes_sent)
+                FROM traffic_history
+                GROUP BY client_id, hour_ts
             """)
 
-            # Last known traffic counters (for delta calculation)
-            # WireGuard resets counters on restart, so we track last known values
+        # Running per-client totals, kept in sync with traffic_history by trigger
+        async with db.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'client_traffic_totals'"
+        ) as cursor:
+            has_totals = await cursor.fetchone() is not None
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS client_traffic_totals (
+                client_id INTEGER PRIMARY KEY,
+                total_rx INTEGER NOT NULL DEFAULT 0,
+                total_tx INTEGER NOT NULL DEFAULT 0,
+                FOREIGN KEY (client_id) REFERENCES clients(id) ON DELETE CASCADE
+            ) WITHOUT ROWID
+        """)
+        await db.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_client_traffic_totals
+            AFTER INSERT ON traffic_history
+            BEGIN
+                INSERT INTO client_traffic_totals (client_id, total_rx, total_tx)
+                VALUES (NEW.client_id, NEW.bytes_received, NEW.bytes_sent)
+                ON CONFLICT(client_id) DO UPDATE SET
+                    total_rx = total_rx + excluded.total_rx,
+                    total_tx = total_tx + excluded.total_tx;
+            END
+        """)
+        if not has_totals:
+            # Backfill from the hourly rollup, which outlives pruned history
             await db.execute("""
-                CREATE TABLE IF NOT EXISTS traffic_counters (
-                    client_id INTEGER PRIMARY KEY,
-                    last_bytes_received INTEGER DEFAULT 0,
-                    last_bytes_sent INTEGER DEFAULT 0,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (client_id) REFERENCES clients(id)
-                )
+                INSERT INTO client_traffic_totals (client_id, total_rx, total_tx)
+                SELECT client_id, SUM(rx), SUM(tx)
+                FROM traffic_history_hourly
+                GROUP BY client_id
             """)
 
-            # Sessions table
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS sessions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    client_id INTEGER NOT NULL,
-                    start_at TIMESTAMP NOT NULL,
-                    end_at TIMESTAMP,
-                    is_active BOOLEAN DEFAULT 1,
-                    FOREIGN KEY (client_id) REFERENCES clients(id)
+        # Server stats table (legacy rows hold local time, hence 'utc')
+        await db.execute(f"CREATE TABLE IF NOT EXISTS server_stats {_SERVER_STATS_COLUMNS}")
+        await self._migrate_epoch(
+            db, "server_stats", "timestamp", _SERVER_STATS_COLUMNS,
+            "id, unixepoch(timestamp, 'utc'), cpu_percent, cpu_count, "
+            "mem_total, mem_used, mem_percent, disk_total, disk_used, disk_percent, "
+            "net_bytes_sent, net_bytes_recv, load_1m, load_5m, load_15m"
+        )
+
+        # Server events table (start/stop/alerts)
+        await db.execute(f"CREATE TABLE IF NOT EXISTS server_events {_SERVER_EVENTS_COLUMNS}")
+        await self._migrate_epoch(
+            db, "server_events", "event_time", _SERVER_EVENTS_COLUMNS,
+            "id, event_type, unixepoch(event_time), details"
+        )
+
+        # Indexes for server stats
+        await db.execute("""
+            CREATE INDEX IF NOT EXISTS idx_server_stats_timestamp
+            ON server_stats(timestamp)
+        """)
+        await db.execute("""
+            CREATE INDEX IF NOT EXISTS idx_server_events_time
+            ON server_events(event_time)
+        """)
+
+        # Hourly server stats rollup (sums and sample counts), kept in sync
+        # by trigger so aggregated reports don't rescan raw samples
+        async with db.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'server_stats_hourly'"
+        ) as cursor:
+            has_stats_rollup = await cursor.fetchone() is not None
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS server_stats_hourly (
+                hour_ts INTEGER PRIMARY KEY,
+                samples INTEGER NOT NULL,
+                cpu_sum REAL NOT NULL,
+                cpu_max REAL NOT NULL,
+                cpu_count_sum INTEGER NOT NULL,
+                mem_total_sum INTEGER NOT NULL,
+                mem_used_sum INTEGER NOT NULL,
+                mem_percent_sum REAL NOT NULL,
+                mem_max REAL NOT NULL,
+                disk_total_sum INTEGER NOT NULL,
+                disk_used_sum INTEGER NOT NULL,
+                disk_percent_sum REAL NOT NULL,
+                net_bytes_sent INTEGER NOT NULL,
+                net_bytes_recv INTEGER NOT NULL,
+                load_samples INTEGER NOT NULL,
+                load_1m_sum REAL NOT NULL,
+                load_5m_sum REAL NOT NULL,
+                load_15m_sum REAL NOT NULL
+            )
+        """)
+        await db.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_server_stats_hourly
+            AFTER INSERT ON server_stats
+            BEGIN
+                INSERT INTO server_stats_hourly VALUES (
+                    NEW.timestamp / 3600 * 3600, 1,
+                    NEW.cpu_percent, NEW.cpu_percent, NEW.cpu_count,
+                    NEW.mem_total, NEW.mem_used, NEW.mem_percent, NEW.mem_percent,
+                    NEW.disk_total, NEW.disk_used, NEW.disk_percent,
+                    NEW.net_bytes_sent, NEW.net_bytes_recv,
+                    NEW.load_1m IS NOT NULL,
+                    COALESCE(NEW.load_1m, 0), COALESCE(NEW.load_5m, 0), COALESCE(NEW.load_15m, 0)
                 )
-            """)
-
-            # Index for faster queries
+                ON CONFLICT(hour_ts) DO UPDATE SET
+                    samples = samples + 1,
+                    cpu_sum = cpu_sum + excluded.cpu_sum,
+                    cpu_max = MAX(cpu_max, excluded.cpu_max),
+                    cpu_count_sum = cpu_count_sum + excluded.cpu_count_sum,
+                    mem_total_sum = mem_total_sum + excluded.mem_total_sum,
+                    mem_used_sum = mem_used_sum + excluded.mem_used_sum,
+                    mem_percent_sum = mem_percent_sum + excluded.mem_percent_sum,
+                    mem_max = MAX(mem_max, excluded.mem_max),
+                    disk_total_sum = disk_total_sum + excluded.disk_total_sum,
+                    disk_used_sum = disk_used_sum + excluded.disk_used_sum,
+                    disk_percent_sum = disk_percent_sum + excluded.disk_percent_sum,
+                    net_bytes_sent = net_bytes_sent + excluded.net_bytes_sent,
+                    net_bytes_recv = net_bytes_recv + excluded.net_bytes_recv,
+                    load_samples = load_samples + excluded.load_samples,
+                    load_1m_sum = load_1m_sum + excluded.load_1m_sum,
+                    load_5m_sum = load_5m_sum + excluded.load_5m_sum,
+                    load_15m_sum = load_15m_sum + excluded.load_15m_sum;
+            END
+        """)
+        if not has_stats_rollup:
+            # Backfill from samples recorded before the rollup existed
             await db.execute("""
-                CREATE INDEX IF NOT EXISTS idx_traffic_history_client
-                ON traffic_history(client_id)
-            """)
-            await db.execute("""
-                CREATE INDEX IF NOT EXISTS idx_traffic_history_time
-                ON traffic_history(recorded_at)
-            """)
-            await db.execute("""
-                CREATE INDEX IF NOT EXISTS idx_sessions_client
-                ON sessions(client_id)
+                INSERT INTO server_stats_hourly
+                SELECT
+                    timestamp / 3600 * 3600 AS hour_ts, COUNT(*),
+                    SUM(cpu_percent), MAX(cpu_percent), SUM(cpu_count),
+                    SUM(mem_total), SUM(mem_used), SUM(mem_percent), MAX(mem_percent),
+                    SUM(disk_total), SUM(disk_used), SUM(disk_percent),
+                    SUM(net_bytes_sent), SUM(net_bytes_recv),
+                    COUNT(load_1m), TOTAL(load_1m), TOTAL(load_5m), TOTAL(load_15m)
+                FROM server_stats
+                GROUP BY hour_ts
             """)
 
-            # Server stats table
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS server_stats (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    cpu_percent REAL NOT NULL,
-                    cpu_count INTEGER NOT NULL,
-                    mem_total INTEGER NOT NULL,
-                    mem_used INTEGER NOT NULL,
-                    mem_percent REAL NOT NULL,
-                    disk_total INTEGER NOT NULL,
-                    disk_used INTEGER NOT NULL,
-                    disk_percent REAL NOT NULL,
-                    net_bytes_sent INTEGER NOT NULL,
-                    net_bytes_recv INTEGER NOT NULL,
-                    load_1m REAL,
-                    load_5m REAL,
-                    load_15m REAL
-                )
-            """)
+        await db.commit()
+        # Not persistent, has to be enabled on every connection
+        await db.execute("PRAGMA foreign_keys=ON")
+
+        if self._write_conn is None:
+            # Plain sqlite3 connection for the collector's batch writes, driven
+            # from asyncio.to_thread() without aiosqlite's per-call queue hop.
+            # Autocommit mode: transactions are opened explicitly.
+            self._write_conn = sqlite3.connect(
+                self.db_path,
+                isolation_level=None,
+                check_same_thread=False,
+                cached_statements=256,
+            )
+            for pragma in _CONNECTION_PRAGMAS:
+                self._write_conn.execute(pragma)
+            self._write_conn.execute("PRAGMA foreign_keys=ON")
+            # Writes are serialized by self._lock; this only covers
+            # checkpoints or other processes holding the file
+            self._write_conn.execute("PRAGMA busy_timeout=5000")
+
+        await self._load_used_octets()
+
+    async def close(self) -> None:
+        """Close the shared connections."""
+        if self._write_conn is not None:
+            self._write_conn.close()
+            self._write_conn = None
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
+
+    async def checkpoint(self) -> None:
+        """Checkpoint the WAL into the main database and truncate it."""
+        async with self._lock:
+            await self._db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    async def _migrate_client_address(self, db: aiosqlite.Connection) -> None:
+        """
+        Convert legacy clients.address TEXT column into integer ip_octet.
+        SQLite can't drop a UNIQUE column, so the table is rebuilt.
+        """
+        async with db.execute("PRAGMA table_info(clients)") as cursor:
+            columns = {row[1] for row in await cursor.fetchall()}
+        if "address" not in columns:
+            return
+
+        # "10.8.0.X/32" -> X (prefix is 7 chars, octet starts at position 8)
+        await db.execute(f"CREATE TABLE clients_new {_CLIENTS_COLUMNS}")
+        await db.execute("""
+            INSERT INTO clients_new
+                (id, name, public_key, private_key, ip_octet, created_at, is_active)
+            SELECT
+                id, name, public_key, private_key,
+                CAST(substr(address, 8, instr(address, '/') - 8) AS INTEGER),
+                created_at, is_active
+            FROM clients
+        """)
+        await db.execute("DROP TABLE clients")
+        await db.execute("ALTER TABLE clients_new RENAME TO clients")
+
+    async def _migrate_current_session(self, db: aiosqlite.Connection) -> None:
+        """Add clients.current_session_id and point it at open sessions."""
+        async with db.execute("PRAGMA table_info(clients)") as cursor:
+            columns = {row[1] for row in await cursor.fetchall()}
+        if "current_session_id" not in columns:
+            await db.execute("ALTER TABLE clients ADD COLUMN current_session_id INTEGER")
+        # Backfill separately from the column check: the clients rebuild in
+        # _migrate_client_address already creates the column, empty
+        await db.execute("""
+            UPDATE clients SET current_session_id = (
+                SELECT MAX(id) FROM sessions
+                WHERE client_id = clients.id AND is_active = 1
+            )
+            WHERE current_session_id IS NULL
+              AND EXISTS (
+                SELECT 1 FROM sessions
+                WHERE client_id = clients.id AND is_active = 1
+              )
+        """)
+
+    async def _migrate_epoch(
+        self,
+        db: aiosqlite.Connection,
+        table: str,
+        column: str,
+        columns: str,
+        select: str
+    ) -> None:
+        """
+        Rebuild a table whose timestamp column is still TEXT into INTEGER
+        unix seconds. select lists the converted legacy values in the
+        column order of columns.
+        """
+        async with db.execute(f"PRAGMA table_info({table})") as cursor:
+            types = {row[1]: row[2] for row in await cursor.fetchall()}
+        if types.get(column) == "INTEGER":
+            return
 
-            # Server events table (start/stop/alerts)
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS server_events (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    event_type TEXT NOT NULL,
-                    event_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    details TEXT
-                )
-            """)
+        await db.execute(f"DROP TABLE IF EXISTS {table}_new")
+        await db.execute(f"CREATE TABLE {table}_new {columns}")
+        await db.execute(f"INSERT INTO {table}_new SELECT {select} FROM {table}")
+        await db.execute(f"DROP TABLE {table}")
+        await db.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
 
-            # Indexes for server stats
-            await db.execute("""
-                CREATE INDEX IF NOT EXISTS idx_server_stats_timestamp
-                ON server_stats(timestamp)
-            """)
-            await db.execute("""
-                CREATE INDEX IF NOT EXISTS idx_server_events_time
-                ON server_events(event_time)
-            """)
+    async def _migrate_counters_without_rowid(self, db: aiosqlite.Connection) -> None:
+        """Rebuild traffic_counters as a WITHOUT ROWID table keyed by client_id.
 
-            await db.commit()
+        Also drops the unused prev_bytes_* columns left by earlier versions.
+        """
+        async with db.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'traffic_counters'"
+        ) as cursor:
+            row = await cursor.fetchone()
+        async with db.execute("PRAGMA table_info(traffic_counters)") as cursor:
+            columns = {col[1] for col in await cursor.fetchall()}
+        if "WITHOUT ROWID" in row[0].upper() and "prev_bytes_received" not in columns:
+            return
+
+        # Recreated by init() right after; a live trigger blocks the rename
+        await db.execute("DROP TRIGGER IF EXISTS trg_clients_counters")
+        await db.execute("DROP TABLE IF EXISTS traffic_counters_new")
+        await db.execute(f"CREATE TABLE traffic_counters_new {_TRAFFIC_COUNTERS_COLUMNS}")
+        await db.execute("""
+            INSERT INTO traffic_counters_new
+                (client_id, last_bytes_received, last_bytes_sent, updated_at)
+            SELECT client_id, last_bytes_received, last_bytes_sent, updated_at
+            FROM traffic_counters
+        """)
+        await db.execute("DROP TABLE traffic_counters")
+        await db.execute("ALTER TABLE traffic_counters_new RENAME TO traffic_counters")
+
+    async def _migrate_cascade(
+        self,
+        db: aiosqlite.Connection,
+        table: str,
+        columns: str
+    ) -> None:
+        """
+        Rebuild a per-client table so its client_id foreign key has
+        ON DELETE CASCADE. Rows of already deleted clients are dropped.
+        """
+        async with db.execute(f"PRAGMA foreign_key_list({table})") as cursor:
+            actions = [row[6] for row in await cursor.fetchall()]
+        if actions and all(action == "CASCADE" for action in actions):
+            return
+
+        await db.execute(f"DROP TABLE IF EXISTS {table}_new")
+        await db.execute(f"CREATE TABLE {table}_new {columns}")
+        await db.execute(f"""
+            INSERT INTO {table}_new
+            SELECT * FROM {table} WHERE client_id IN (SELECT id FROM clients)
+        """)
+        await db.execute(f"DROP TABLE {table}")
+        await db.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+
+    async def _load_used_octets(self) -> None:
+        """Reload allocated octets from the database."""
+        db = self._db
+        async with db.execute("SELECT ip_octet FROM clients") as cursor:
+            cursor.row_factory = None
+            self._used_octets = {row[0] for row in await cursor.fetchall()}
+        self._next_octet_hint = 2
 
     async def add_client(
         self,
@@ -156,483 +806,426 @@ class Database:
         address: str
     ) -> Client:
         """Add a new VPN client."""
-        async with aiosqlite.connect(self.db_path) as db:
-            cursor = await db.execute(
-                """
-                INSERT INTO clients (name, public_key, private_key, address)
-                VALUES (?, ?, ?, ?)
-                """,
-                (name, public_key, private_key, address)
-            )
-            await db.commit()
+        ip_octet = _octet_from_address(address)
+        async with self._lock:
+            db = self._db
+            # trg_clients_counters creates the traffic counter in the same statement
+            try:
+                cursor = await db.execute(
+                    """
+                    INSERT INTO clients (name, public_key, private_key, ip_octet)
+                    VALUES (?, ?, ?, ?)
+                    """,
+                    (name, public_key, private_key, ip_octet)
+                )
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                raise
 
-            # Initialize traffic counter
-            await db.execute(
-                """
-                INSERT INTO traffic_counters (client_id, last_bytes_received, last_bytes_sent)
-                VALUES (?, 0, 0)
-                """,
-                (cursor.lastrowid,)
-            )
-            await db.commit()
+            self._used_octets.add(ip_octet)
 
             return Client(
                 id=cursor.lastrowid,
                 name=name,
                 public_key=public_key,
                 private_key=private_key,
-                address=address,
-                created_at=datetime.now(),
+                ip_octet=ip_octet,
+                created_ts=int(time.time()),
                 is_active=True
             )
 
     async def get_client_by_name(self, name: str) -> Optional[Client]:
         """Get client by name."""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            async with db.execute(
-                "SELECT * FROM clients WHERE name = ?", (name,)
-            ) as cursor:
-                row = await cursor.fetchone()
-                if row:
-                    return Client(
-                        id=row["id"],
-                        name=row["name"],
-                        public_key=row["public_key"],
-                        private_key=row["private_key"],
-                        address=row["address"],
-                        created_at=datetime.fromisoformat(row["created_at"]),
-                        is_active=bool(row["is_active"])
-                    )
+        db = self._db
+        async with db.execute(
+            _SQL_GET_CLIENT_BY_NAME, (name,)
+        ) as cursor:
+            cursor.row_factory = None
+            row = await cursor.fetchone()
+            if row:
+                return _client_from_row(row)
         return None
 
     async def get_client_by_public_key(self, public_key: str) -> Optional[Client]:
         """Get client by public key."""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            async with db.execute(
-                "SELECT * FROM clients WHERE public_key = ?", (public_key,)
-            ) as cursor:
-                row = await cursor.fetchone()
-                if row:
-                    return Client(
-                        id=row["id"],
-                        name=row["name"],
-                        public_key=row["public_key"],
-                        private_key=row["private_key"],
-                        address=row["address"],
-                        created_at=datetime.fromisoformat(row["created_at"]),
-                        is_active=bool(row["is_active"])
-                    )
+        db = self._db
+        async with db.execute(
+            _SQL_GET_CLIENT_BY_PUBLIC_KEY, (public_key,)
+        ) as cursor:
+            cursor.row_factory = None
+            row = await cursor.fetchone()
+            if row:
+                return _client_from_row(row)
         return None
 
     async def get_all_clients(self) -> list[Client]:
         """Get all active clients."""
-        clients = []
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            async with db.execute(
-                "SELECT * FROM clients WHERE is_active = 1 ORDER BY id"
-            ) as cursor:
-                async for row in cursor:
-                    clients.append(Client(
-                        id=row["id"],
-                        name=row["name"],
-                        public_key=row["public_key"],
-                        private_key=row["private_key"],
-                        address=row["address"],
-                        created_at=datetime.fromisoformat(row["created_at"]),
-                        is_active=bool(row["is_active"])
-                    ))
-        return clients
+        db = self._db
+        async with db.execute(
+            _SQL_GET_ACTIVE_CLIENTS
+        ) as cursor:
+            cursor.row_factory = None
+            return [_client_from_row(row) for row in await cursor.fetchall()]
+
+    async def get_active_peer_config(self) -> list[dict]:
+        """
+        Get active clients as server config peers.
+        Returns list of {public_key, address}.
+        """
+        db = self._db
+        async with db.execute(
+            "SELECT public_key, ip_octet FROM clients WHERE is_active = 1 ORDER BY id"
+        ) as cursor:
+            cursor.row_factory = None
+            return [
+                {"public_key": public_key, "address": f"{VPN_SUBNET_PREFIX}{ip_octet}/32"}
+                for public_key, ip_octet in await cursor.fetchall()
+            ]
+
+    async def get_active_clients_by_pubkey(self) -> dict[str, Client]:
+        """Get all active clients keyed by public key (one query)."""
+        db = self._db
+        async with db.execute(
+            _SQL_GET_ACTIVE_CLIENTS
+        ) as cursor:
+            cursor.row_factory = None
+            clients = [_client_from_row(row) for row in await cursor.fetchall()]
+        return {client.public_key: client for client in clients}
 
     async def get_next_available_ip(self) -> str:
         """Get next available IP address in the 10.8.0.0/24 subnet."""
-        async with aiosqlite.connect(self.db_path) as db:
-            async with db.execute(
-                "SELECT address FROM clients ORDER BY id"
-            ) as cursor:
-                used_ips = set()
-                async for row in cursor:
-                    # Extract IP number from "10.8.0.X/32"
-                    ip = row[0].split("/")[0]
-                    last_octet = int(ip.split(".")[-1])
-                    used_ips.add(last_octet)
-
-            # Start from .2 (server is .1)
-            for i in range(2, 255):
-                if i not in used_ips:
-                    return f"10.8.0.{i}/32"
-
+        # Start from .2 (server is .1)
+        for i in range(self._next_octet_hint, 255):
+            if i not in self._used_octets:
+                self._next_octet_hint = i
+                return f"{VPN_SUBNET_PREFIX}{i}/32"
+
+        # Hint exhausted - cache may be stale, let SQLite find the lowest
+        # free octet. The anti-join probes the ip_octet UNIQUE index per
+        # candidate and stops at the first gap, instead of building the
+        # full set of used octets first.
+        async with self._db.execute("""
+            WITH RECURSIVE seq(n) AS (
+                SELECT 2 UNION ALL SELECT n + 1 FROM seq WHERE n < 254
+            )
+            SELECT n FROM seq
+            LEFT JOIN clients c ON c.ip_octet = seq.n
+            WHERE c.id IS NULL
+            LIMIT 1
+        """) as cursor:
+            cursor.row_factory = None
+            row = await cursor.fetchone()
+        if row is None:
             raise ValueError("No available IP addresses in subnet")
 
-    async def update_traffic_counters(
+        await self._load_used_octets()
+        self._next_octet_hint = row[0]
+        return f"{VPN_SUBNET_PREFIX}{row[0]}/32"
+
+    async def update_traffic_counters_bulk(
         self,
-        client_id: int,
-        current_received: int,
-        current_sent: int
-    ) -> tuple[int, int]:
+        samples: list[tuple[int, int, int]]
+    ) -> dict[int, tuple[int, int]]:
         """
-        Update traffic counters and return delta.
-        Handles WireGuard counter resets gracefully.
-        Returns (delta_received, delta_sent).
+        Update traffic counters for many clients in one transaction.
+        samples: list of (client_id, current_received, current_sent).
+        Returns dict: {client_id: (delta_received, delta_sent)}
         """
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-
-            # Get last known counters
-            async with db.execute(
-                "SELECT * FROM traffic_counters WHERE client_id = ?",
-                (client_id,)
-            ) as cursor:
-                row = await cursor.fetchone()
-
-            is_first_measurement = False
-            if row:
-                last_received = row["last_bytes_received"]
-                last_sent = row["last_bytes_sent"]
+        if not samples:
+            return {}
 
-                # Calculate delta (handle counter reset)
-                if current_received >= last_received:
-                    delta_received = current_received - last_received
-                else:
-                    # Counter was reset, use current value as delta
-                    delta_received = current_received
+        async with self._lock:
+            return await asyncio.to_thread(self._write_counters_batch, samples)
 
-                if current_sent >= last_sent:
-                    delta_sent = current_sent - last_sent
-                else:
-                    delta_sent = current_sent
-            else:
-                # First measurement - treat as initialization
-                # We return 0 delta to avoid recording historical traffic as current
-                delta_received = 0
-                delta_sent = 0
-                is_first_measurement = True
-
-            # Update counters
-            await db.execute(
-                """
-                INSERT OR REPLACE INTO traffic_counters
-                (client_id, last_bytes_received, last_bytes_sent, updated_at)
-                VALUES (?, ?, ?, CURRENT_TIMESTAMP)
-                """,
-                (client_id, current_received, current_sent)
-            )
-
-            # Record to history if there's actual traffic AND it's not the initialization step
-            if (delta_received > 0 or delta_sent > 0) and not is_first_measurement:
-                await db.execute(
-                    """
-                    INSERT INTO traffic_history (client_id, bytes_received, bytes_sent)
-                    VALUES (?, ?, ?)
-                    """,
-                    (client_id, delta_received, delta_sent)
+    def _write_counters_batch(
+        self,
+        samples: list[tuple[int, int, int]]
+    ) -> dict[int, tuple[int, int]]:
+        """Blocking body of update_traffic_counters_bulk, run in a worker thread."""
+        conn = self._write_conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Fetch all last known counters at once
+            last = {
+                row[0]: (row[1], row[2])
+                for row in conn.execute(
+                    _SQL_GET_LAST_COUNTERS,
+                    (_json_dumps([client_id for client_id, _, _ in samples]),)
                 )
+            }
+
+            deltas = {}
+            history = []
+            for client_id, current_received, current_sent in samples:
+                if client_id in last:
+                    last_received, last_sent = last[client_id]
+                    delta_received = _counter_delta(current_received, last_received)
+                    delta_sent = _counter_delta(current_sent, last_sent)
+                    if delta_received > 0 or delta_sent > 0:
+                        history.append((client_id, delta_received, delta_sent))
+                else:
+                    # First measurement - initialization only, no history
+                    delta_received = delta_sent = 0
+                deltas[client_id] = (delta_received, delta_sent)
 
-            await db.commit()
+            conn.executemany(_SQL_SET_COUNTERS, samples)
+            if history:
+                conn.executemany(_SQL_INSERT_HISTORY, history)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
 
-            return delta_received, delta_sent
+        return deltas
 
     async def get_total_traffic_by_client(self) -> dict[str, tuple[int, int]]:
         """
         Get total traffic per client.
         Returns dict: {client_name: (total_received, total_sent)}
         """
-        result = {}
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            async with db.execute(
-                """
-                SELECT
-                    c.name,
-                    COALESCE(SUM(t.bytes_received), 0) as total_received,
-                    COALESCE(SUM(t.bytes_sent), 0) as total_sent
-                FROM clients c
-                LEFT JOIN traffic_history t ON c.id = t.client_id
-                WHERE c.is_active = 1
-                GROUP BY c.id, c.name
-                ORDER BY (total_received + total_sent) DESC
-                """
-            ) as cursor:
-                async for row in cursor:
-                    result[row["name"]] = (row["total_received"], row["total_sent"])
-
-        return result
+        db = self._db
+        async with db.execute(
+            """
+            SELECT
+                c.name,
+                COALESCE(t.total_rx, 0) as total_received,
+                COALESCE(t.total_tx, 0) as total_sent
+            FROM clients c
+            LEFT JOIN client_traffic_totals t ON c.id = t.client_id
+            WHERE c.is_active = 1
+            ORDER BY (total_received + total_sent) DESC
+            """
+        ) as cursor:
+            cursor.row_factory = None
+            return {
+                name: (total_received, total_sent)
+                for name, total_received, total_sent in await cursor.fetchall()
+            }
 
     async def get_client_total_traffic(self, client_id: int) -> tuple[int, int]:
         """
         Get total traffic for a single client.
         Returns (total_received, total_sent).
         """
-        async with aiosqlite.connect(self.db_path) as db:
-            async with db.execute(
-                """
-                SELECT 
-                    COALESCE(SUM(bytes_received), 0),
-                    COALESCE(SUM(bytes_sent), 0)
-                FROM traffic_history
-                WHERE client_id = ?
-                """,
-                (client_id,)
-            ) as cursor:
-                row = await cursor.fetchone()
-                return row[0], row[1]
+        db = self._db
+        async with db.execute(
+            "SELECT total_rx, total_tx FROM client_traffic_totals WHERE client_id = ?",
+            (client_id,)
+        ) as cursor:
+            cursor.row_factory = None
+            row = await cursor.fetchone()
+            return (row[0], row[1]) if row else (0, 0)
 
     async def delete_client(self, name: str) -> bool:
         """Delete a client completely (hard delete)."""
-        async with aiosqlite.connect(self.db_path) as db:
-            # Get client ID first
+        async with self._lock:
+            db = self._db
+            # History, rollup, counters and sessions follow via ON DELETE CASCADE
             async with db.execute(
-                "SELECT id FROM clients WHERE name = ?", (name,)
+                "DELETE FROM clients WHERE name = ? RETURNING ip_octet", (name,)
             ) as cursor:
+                cursor.row_factory = None
                 row = await cursor.fetchone()
-                if not row:
-                    return False
-                client_id = row[0]
-
-            # Delete traffic history
-            await db.execute(
-                "DELETE FROM traffic_history WHERE client_id = ?",
-                (client_id,)
-            )
-            # Delete traffic counters
-            await db.execute(
-                "DELETE FROM traffic_counters WHERE client_id = ?",
-                (client_id,)
-            )
-            # Delete client
-            await db.execute(
-                "DELETE FROM clients WHERE id = ?",
-                (client_id,)
-            )
             await db.commit()
+            if not row:
+                return False
+
+            # Freed address becomes the lowest candidate again
+            octet = row[0]
+            self._used_octets.discard(octet)
+            self._next_octet_hint = min(self._next_octet_hint, octet)
             return True
 
+    async def prune_old_history(self, days: int = 30) -> int:
+        """
+        Delete raw traffic_history rows older than N days.
+        Hourly totals are kept in traffic_history_hourly.
+        Returns number of deleted rows.
+        """
+        return await self._delete_older_than(
+            "traffic_history", "recorded_at", _epoch_cutoff(days=days)
+        )
+
     async def client_exists(self, name: str) -> bool:
         """Check if client with given name exists."""
-        async with aiosqlite.connect(self.db_path) as db:
-            async with db.execute(
-                "SELECT 1 FROM clients WHERE name = ?",
-                (name,)
-            ) as cursor:
-                return await cursor.fetchone() is not None
+        db = self._db
+        async with db.execute(
+            _SQL_CLIENT_EXISTS, (name,)
+        ) as cursor:
+            cursor.row_factory = None
+            row = await cursor.fetchone()
+            return bool(row[0])
+
     async def get_traffic_series(self, days: int = 1, client_id: Optional[int] = None) -> list[dict]:
         """
         Get traffic history grouped by hour for the last N days.
         Returns list of {timestamp, rx, tx}.
         """
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            
-            # Format time to hour precision
-            query = """
-                SELECT 
-                    strftime('%Y-%m-%d %H:00:00', recorded_at) as ts,
-                    SUM(bytes_received) as rx,
-                    SUM(bytes_sent) as tx
-                FROM traffic_history
-                WHERE recorded_at >= datetime('now', ?)
-            """
-            params = [f"-{days} days"]
-            
-            if client_id:
-                query += " AND client_id = ?"
-                params.append(client_id)
-                
-            query += " GROUP BY ts ORDER BY ts"
-            
-            async with db.execute(query, tuple(params)) as cursor:
-                return [dict(row) for row in await cursor.fetchall()]
+        db = self._db
+
+        # Hour buckets come from the rollup; the cutoff is floored to the hour
+        # so the partially covered first hour is included
+        cutoff = _epoch_cutoff(days=days)
+        cutoff -= cutoff % 3600
+        if client_id:
+            query, params = _SQL_TRAFFIC_SERIES_CLIENT, (cutoff, client_id)
+        else:
+            query, params = _SQL_TRAFFIC_SERIES, (cutoff,)
+
+        async with db.execute(query, params) as cursor:
+            return await _fetch_dicts(cursor)
 
     async def get_traffic_series_range(self, start_date: str, end_date: str, client_id: Optional[int] = None) -> list[dict]:
         """
         Get traffic history grouped by hour for a specific date range.
         Dates should be 'YYYY-MM-DD'.
         """
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            
-            # We append times to date strings to cover the full range
-            start_ts = f"{start_date} 00:00:00"
-            end_ts = f"{end_date} 23:59:59"
-            
-            query = """
-                SELECT 
-                    strftime('%Y-%m-%d %H:00:00', recorded_at) as ts,
-                    SUM(bytes_received) as rx,
-                    SUM(bytes_sent) as tx
-                FROM traffic_history
-                WHERE recorded_at BETWEEN ? AND ?
-            """
-            params = [start_ts, end_ts]
-            
-            if client_id:
-                query += " AND client_id = ?"
-                params.append(client_id)
-                
-            query += " GROUP BY ts ORDER BY ts"
-            
-            async with db.execute(query, tuple(params)) as cursor:
-                return [dict(row) for row in await cursor.fetchall()]
+        db = self._db
+
+        # Dates are UTC days; cover the full range up to 23:59:59
+        start_ts = _date_epoch(start_date, utc=True)
+        end_ts = _date_epoch(end_date, end_of_day=True, utc=True)
+        if client_id:
+            query, params = _SQL_TRAFFIC_SERIES_RANGE_CLIENT, (start_ts, end_ts, client_id)
+        else:
+            query, params = _SQL_TRAFFIC_SERIES_RANGE, (start_ts, end_ts)
+
+        async with db.execute(query, params) as cursor:
+            return await _fetch_dicts(cursor)
 
     async def get_hourly_activity(self, client_id: Optional[int] = None) -> list[dict]:
         """
         Get average traffic volume aggregated by hour of day (0-23).
-        Returns list of {hour, total_bytes}.
-        """
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            
-            query = """
-                SELECT 
-                    cast(strftime('%H', recorded_at) as int) as hour,
-                    AVG(bytes_received + bytes_sent) as avg_bytes,
-                    SUM(bytes_received + bytes_sent) as total_bytes
-                FROM traffic_history
-            """
-            params = []
-            
-            if client_id:
-                query += " WHERE client_id = ?"
-                params.append(client_id)
-                
-            query += " GROUP BY hour ORDER BY hour"
-            
-            async with db.execute(query, tuple(params)) as cursor:
-                return [dict(row) for row in await cursor.fetchall()]
+        Returns list of {hour, avg_bytes, total_bytes}; avg_bytes is per active hour.
+        """
+        db = self._db
+        if client_id:
+            query, params = _SQL_HOURLY_ACTIVITY_CLIENT, (client_id,)
+        else:
+            query, params = _SQL_HOURLY_ACTIVITY, ()
+
+        async with db.execute(query, params) as cursor:
+            return await _fetch_dicts(cursor)
 
     async def get_weekly_activity(self, client_id: Optional[int] = None) -> list[dict]:
         """
         Get traffic volume aggregated by day of week (0=Sunday, 6=Saturday).
         Returns list of {weekday, total_bytes}.
         """
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            
-            # strftime %w gives 0-6 (Sunday-Saturday)
-            query = """
-                SELECT 
-                    cast(strftime('%w', recorded_at) as int) as weekday,
-                    SUM(bytes_received + bytes_sent) as total_bytes
-                FROM traffic_history
-            """
-            params = []
-            
-            if client_id:
-                query += " WHERE client_id = ?"
-                params.append(client_id)
-                
-            query += " GROUP BY weekday ORDER BY weekday"
-            
-            async with db.execute(query, tuple(params)) as cursor:
-                return [dict(row) for row in await cursor.fetchall()]
+        db = self._db
+        if client_id:
+            query, params = _SQL_WEEKLY_ACTIVITY_CLIENT, (client_id,)
+        else:
+            query, params = _SQL_WEEKLY_ACTIVITY, ()
+
+        async with db.execute(query, params) as cursor:
+            return await _fetch_dicts(cursor)
 
     # --- Session Management ---
 
     async def get_active_session(self, client_id: int) -> Optional[dict]:
         """Get the currently active session for a client."""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            async with db.execute(
-                "SELECT * FROM sessions WHERE client_id = ? AND is_active = 1 LIMIT 1",
-                (client_id,)
-            ) as cursor:
-                row = await cursor.fetchone()
-                return dict(row) if row else None
+        db = self._db
+        async with db.execute(
+            _SQL_GET_ACTIVE_SESSION, (client_id,)
+        ) as cursor:
+            row = await cursor.fetchone()
+            return dict(row) if row else None
+
+    async def get_active_session_client_ids(self) -> set[int]:
+        """Get IDs of clients that have an open session."""
+        db = self._db
+        async with db.execute(
+            "SELECT id FROM clients WHERE current_session_id IS NOT NULL"
+        ) as cursor:
+            cursor.row_factory = None
+            return {row[0] for row in await cursor.fetchall()}
 
     async def start_session(self, client_id: int, start_at: datetime) -> None:
-        """Create a new active session."""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute(
-                "INSERT INTO sessions (client_id, start_at, is_active) VALUES (?, ?, 1)",
-                (client_id, start_at.isoformat())
-            )
-            await db.commit()
+        """
+        Create a new active session. A session still open for the client
+        is ended at start_at in the same transaction.
+        """
+        ts = int(start_at.timestamp())
+        async with self._lock:
+            db = self._db
+            await db.execute("BEGIN IMMEDIATE")
+            try:
+                await db.execute(_SQL_END_SESSION, (ts, client_id))
+                cursor = await db.execute(_SQL_START_SESSION, (client_id, ts))
+                await db.execute(_SQL_SET_CURRENT_SESSION, (cursor.lastrowid, client_id))
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                raise
 
     async def end_session(self, client_id: int, end_at: datetime) -> None:
         """Close the active session for a client."""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._lock:
+            db = self._db
             await db.execute(
-                "UPDATE sessions SET end_at = ?, is_active = 0 WHERE client_id = ? AND is_active = 1",
-                (end_at.isoformat(), client_id)
+                _SQL_END_SESSION, (int(end_at.timestamp()), client_id)
             )
+            await db.execute(_SQL_SET_CURRENT_SESSION, (None, client_id))
             await db.commit()
 
     async def get_last_session(self, client_id: int) -> Optional[dict]:
         """Get the most recently completed or currently active session."""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            async with db.execute(
-                "SELECT * FROM sessions WHERE client_id = ? ORDER BY start_at DESC LIMIT 1",
-                (client_id,)
-            ) as cursor:
-                row = await cursor.fetchone()
-                return dict(row) if row else None
+        db = self._db
+        async with db.execute(
+            f"{_SESSION_SELECT} WHERE client_id = ? ORDER BY sessions.start_at DESC LIMIT 1",
+            (client_id,)
+        ) as cursor:
+            row = await cursor.fetchone()
+            return dict(row) if row else None
 
     async def get_average_session_duration(self, client_id: int, days: Optional[int] = None, minutes: Optional[int] = None) -> float:
         """
         Get average session duration in minutes for a specific period.
         """
-        async with aiosqlite.connect(self.db_path) as db:
-            query = "SELECT AVG(strftime('%s', end_at) - strftime('%s', start_at)) FROM sessions WHERE client_id = ? AND end_at IS NOT NULL"
-            params = [client_id]
-            
-            if days:
-                query += " AND start_at >= datetime('now', ?)"
-                params.append(f"-{days} days")
-            elif minutes:
-                query += " AND start_at >= datetime('now', ?)"
-                params.append(f"-{minutes} minutes")
-            
-            async with db.execute(query, tuple(params)) as cursor:
-                row = await cursor.fetchone()
-                # row[0] is average seconds
-                return (row[0] / 60.0) if row and row[0] is not None else 0.0
+        db = self._db
+        query = "SELECT AVG(end_at - start_at) FROM sessions WHERE client_id = ? AND end_at IS NOT NULL"
+        params = [client_id]
+        
+        if days:
+            query += " AND start_at >= ?"
+            params.append(_epoch_cutoff(days=days))
+        elif minutes:
+            query += " AND start_at >= ?"
+            params.append(_epoch_cutoff(minutes=minutes))
+        
+        async with db.execute(query, tuple(params)) as cursor:
+            cursor.row_factory = None
+            row = await cursor.fetchone()
+            # row[0] is average seconds
+            return (row[0] / 60.0) if row and row[0] is not None else 0.0
 
     async def get_minute_traffic_series(self, client_id: Optional[int] = None, minutes: int = 60) -> list[dict]:
         """
         Get traffic history grouped by minute for the last N minutes.
         """
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-
-            query = """
-                SELECT
-                    strftime('%Y-%m-%d %H:%M:00', recorded_at) as ts,
-                    SUM(bytes_received) as rx,
-                    SUM(bytes_sent) as tx
-                FROM traffic_history
-                WHERE recorded_at >= datetime('now', ?)
-            """
-            params = [f"-{minutes} minutes"]
-
-            if client_id:
-                query += " AND client_id = ?"
-                params.append(client_id)
+        db = self._db
 
-            query += " GROUP BY ts ORDER BY ts"
+        cutoff = _epoch_cutoff(minutes=minutes)
+        if client_id:
+            query, params = _SQL_MINUTE_SERIES_CLIENT, (cutoff, client_id)
+        else:
+            query, params = _SQL_MINUTE_SERIES, (cutoff,)
 
-            async with db.execute(query, tuple(params)) as cursor:
-                return [dict(row) for row in await cursor.fetchall()]
+        async with db.execute(query, params) as cursor:
+            return await _fetch_dicts(cursor)
 
     # --- Server Monitoring ---
 
     async def save_server_metrics(self, metrics) -> None:
         """Save server metrics snapshot to database."""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._lock:
+            db = self._db
             await db.execute(
-                """
-                INSERT INTO server_stats (
-                    timestamp, cpu_percent, cpu_count,
-                    mem_total, mem_used, mem_percent,
-                    disk_total, disk_used, disk_percent,
-                    net_bytes_sent, net_bytes_recv,
-                    load_1m, load_5m, load_15m
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """,
+                _SQL_INSERT_SERVER_STATS,
                 (
-                    metrics.timestamp.isoformat(),
+                    int(metrics.timestamp.timestamp()),
                     metrics.cpu_percent,
                     metrics.cpu_count,
                     metrics.mem_total,
@@ -661,175 +1254,221 @@ class Database:
         Get server stats time series.
         Returns list of dicts with metrics.
         """
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-
-            if minutes:
-                query = """
-                    SELECT * FROM server_stats
-                    WHERE timestamp >= datetime('now', ?)
-                    ORDER BY timestamp
-                """
-                params = (f"-{minutes} minutes",)
-            elif days:
-                query = """
-                    SELECT * FROM server_stats
-                    WHERE timestamp >= datetime('now', ?)
-                    ORDER BY timestamp
-                """
-                params = (f"-{days} days",)
-            elif start_date and end_date:
-                query = """
-                    SELECT * FROM server_stats
-                    WHERE timestamp BETWEEN ? AND ?
-                    ORDER BY timestamp
-                """
-                params = (f"{start_date} 00:00:00", f"{end_date} 23:59:59")
-            else:
-                # Default: last 24 hours
-                query = """
-                    SELECT * FROM server_stats
-                    WHERE timestamp >= datetime('now', '-1 day')
-                    ORDER BY timestamp
-                """
-                params = ()
-
-            async with db.execute(query, params) as cursor:
-                return [dict(row) for row in await cursor.fetchall()]
+        db = self._db
+
+        if minutes:
+            query = f"""
+                {_SERVER_STATS_SELECT}
+                WHERE server_stats.timestamp >= ?
+                ORDER BY server_stats.timestamp
+            """
+            params = (_epoch_cutoff(minutes=minutes),)
+        elif days:
+            query = f"""
+                {_SERVER_STATS_SELECT}
+                WHERE server_stats.timestamp >= ?
+                ORDER BY server_stats.timestamp
+            """
+            params = (_epoch_cutoff(days=days),)
+        elif start_date and end_date:
+            query = f"""
+                {_SERVER_STATS_SELECT}
+                WHERE server_stats.timestamp BETWEEN ? AND ?
+                ORDER BY server_stats.timestamp
+            """
+            params = (_date_epoch(start_date), _date_epoch(end_date, end_of_day=True))
+        else:
+            # Default: last 24 hours
+            query = f"""
+                {_SERVER_STATS_SELECT}
+                WHERE server_stats.timestamp >= ?
+                ORDER BY server_stats.timestamp
+            """
+            params = (_epoch_cutoff(days=1),)
+
+        async with db.execute(query, params) as cursor:
+            return await _fetch_dicts(cursor)
 
     async def get_server_stats_aggregated(
         self,
         days: Optional[int] = None,
-        group_by: str = 'hour'
+        group_by: str = 'hour',
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None
     ) -> list[dict]:
         """
         Get aggregated server stats (by hour or day).
-        Used for long periods (30 days, all time).
+        Used for long periods (30 days, all time) and date ranges older
+        than the raw sample retention. Reads the server_stats_hourly rollup.
+        """
+        db = self._db
+
+        # Hours map 1:1 to rollup rows; days need the local calendar date
+        if group_by == 'day':
+            time_format = '%Y-%m-%d'
+            bucket = "strftime('%Y-%m-%d', hour_ts, 'unixepoch', 'localtime')"
+        else:  # hour
+            time_format = '%Y-%m-%d %H:00'
+            bucket = "hour_ts"
+
+        query = f"""
+            SELECT
+                strftime('{time_format}', MIN(hour_ts), 'unixepoch', 'localtime') as timestamp,
+                SUM(cpu_sum) / SUM(samples) as cpu_percent,
+                MAX(cpu_max) as cpu_max,
+                SUM(cpu_count_sum) * 1.0 / SUM(samples) as cpu_count,
+                SUM(mem_total_sum) * 1.0 / SUM(samples) as mem_total,
+                SUM(mem_used_sum) * 1.0 / SUM(samples) as mem_used,
+                SUM(mem_percent_sum) / SUM(samples) as mem_percent,
+                MAX(mem_max) as mem_max,
+                SUM(disk_total_sum) * 1.0 / SUM(samples) as disk_total,
+                SUM(disk_used_sum) * 1.0 / SUM(samples) as disk_used,
+                SUM(disk_percent_sum) / SUM(samples) as disk_percent,
+                SUM(net_bytes_sent) as net_bytes_sent,
+                SUM(net_bytes_recv) as net_bytes_recv,
+                SUM(load_1m_sum) / NULLIF(SUM(load_samples), 0) as load_1m,
+                SUM(load_5m_sum) / NULLIF(SUM(load_samples), 0) as load_5m,
+                SUM(load_15m_sum) / NULLIF(SUM(load_samples), 0) as load_15m
+            FROM server_stats_hourly
         """
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        params = []
 
-            if group_by == 'day':
-                time_format = '%Y-%m-%d'
-            else:  # hour
-                time_format = '%Y-%m-%d %H:00'
+        if days:
+            cutoff = _epoch_cutoff(days=days)
+            query += " WHERE hour_ts >= ?"
+            params.append(cutoff - cutoff % 3600)
+        elif start_date and end_date:
+            start = _date_epoch(start_date)
+            query += " WHERE hour_ts BETWEEN ? AND ?"
+            params += [start - start % 3600, _date_epoch(end_date, end_of_day=True)]
 
-            query = f"""
-                SELECT
-                    strftime('{time_format}', timestamp) as timestamp,
-                    AVG(cpu_percent) as cpu_percent,
-                    MAX(cpu_percent) as cpu_max,
-                    AVG(cpu_count) as cpu_count,
-                    AVG(mem_total) as mem_total,
-                    AVG(mem_used) as mem_used,
-                    AVG(mem_percent) as mem_percent,
-                    MAX(mem_percent) as mem_max,
-                    AVG(disk_total) as disk_total,
-                    AVG(disk_used) as disk_used,
-                    AVG(disk_percent) as disk_percent,
-                    SUM(net_bytes_sent) as net_bytes_sent,
-                    SUM(net_bytes_recv) as net_bytes_recv,
-                    AVG(load_1m) as load_1m,
-                    AVG(load_5m) as load_5m,
-                    AVG(load_15m) as load_15m
-                FROM server_stats
-            """
-            params = []
+        query += f" GROUP BY {bucket} ORDER BY MIN(hour_ts)"
 
-            if days:
-                query += " WHERE timestamp >= datetime('now', ?)"
-                params.append(f"-{days} days")
+        async with db.execute(query, tuple(params)) as cursor:
+            return await _fetch_dicts(cursor)
 
-            query += f" GROUP BY strftime('{time_format}', timestamp) ORDER BY timestamp"
+    async def get_server_stats_range(self, start_date: str, end_date: str) -> list[dict]:
+        """
+        Get server stats for a 'YYYY-MM-DD' date range.
+        Raw samples are used while they still cover the start date; older
+        ranges come from the hourly rollup, by day for spans over a month.
+        """
+        db = self._db
+        async with db.execute("SELECT MIN(timestamp) FROM server_stats") as cursor:
+            cursor.row_factory = None
+            oldest = (await cursor.fetchone())[0]
+
+        if oldest is not None and oldest <= _date_epoch(start_date):
+            return await self.get_server_stats_series(start_date=start_date, end_date=end_date)
 
-            async with db.execute(query, tuple(params)) as cursor:
-                return [dict(row) for row in await cursor.fetchall()]
+        span_days = (_date_epoch(end_date) - _date_epoch(start_date)) // 86400
+        return await self.get_server_stats_aggregated(
+            group_by='day' if span_days > 31 else 'hour',
+            start_date=start_date,
+            end_date=end_date
+        )
 
     async def get_server_stats_latest(self) -> Optional[dict]:
         """Get most recent server stats."""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            async with db.execute(
-                "SELECT * FROM server_stats ORDER BY timestamp DESC LIMIT 1"
-            ) as cursor:
-                row = await cursor.fetchone()
-                return dict(row) if row else None
+        db = self._db
+        async with db.execute(
+            f"{_SERVER_STATS_SELECT} ORDER BY server_stats.timestamp DESC LIMIT 1"
+        ) as cursor:
+            row = await cursor.fetchone()
+            return dict(row) if row else None
 
     async def get_server_stats_peaks(self, days: int = 7) -> dict:
         """
         Get peak values for server metrics over specified period.
         Returns dict with max and avg values.
         """
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            async with db.execute(
-                """
-                SELECT
-                    MAX(cpu_percent) as peak_cpu,
-                    MAX(mem_percent) as peak_mem,
-                    MAX(disk_percent) as peak_disk,
-                    MAX(net_bytes_sent) as peak_net_sent,
-                    MAX(net_bytes_recv) as peak_net_recv,
-                    AVG(cpu_percent) as avg_cpu,
-                    AVG(mem_percent) as avg_mem,
-                    AVG(disk_percent) as avg_disk
-                FROM server_stats
-                WHERE timestamp >= datetime('now', ?)
-                """,
-                (f"-{days} days",)
-            ) as cursor:
-                row = await cursor.fetchone()
-                return dict(row) if row else {}
+        db = self._db
+        async with db.execute(
+            """
+            SELECT
+                MAX(cpu_percent) as peak_cpu,
+                MAX(mem_percent) as peak_mem,
+                MAX(disk_percent) as peak_disk,
+                MAX(net_bytes_sent) as peak_net_sent,
+                MAX(net_bytes_recv) as peak_net_recv,
+                AVG(cpu_percent) as avg_cpu,
+                AVG(mem_percent) as avg_mem,
+                AVG(disk_percent) as avg_disk
+            FROM server_stats
+            WHERE timestamp >= ?
+            """,
+            (_epoch_cutoff(days=days),)
+        ) as cursor:
+            row = await cursor.fetchone()
+            return dict(row) if row else {}
 
     async def record_server_event(self, event_type: str, details: dict = None) -> None:
         """Record server event (start, stop, alert)."""
-        import json
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._lock:
+            db = self._db
             await db.execute(
-                "INSERT INTO server_events (event_type, details) VALUES (?, ?)",
-                (event_type, json.dumps(details) if details else None)
+                _SQL_INSERT_SERVER_EVENT,
+                (event_type, _json_dumps(details) if details else None)
             )
             await db.commit()
 
     async def get_server_events(self, days: int = 30, event_type: Optional[str] = None) -> list[dict]:
         """Get server events history."""
-        import json
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-
-            query = """
-                SELECT * FROM server_events
-                WHERE event_time >= datetime('now', ?)
-            """
-            params = [f"-{days} days"]
-
-            if event_type:
-                query += " AND event_type = ?"
-                params.append(event_type)
-
-            query += " ORDER BY event_time DESC"
-
-            async with db.execute(query, tuple(params)) as cursor:
-                results = []
-                async for row in cursor:
-                    d = dict(row)
-                    if d.get('details'):
-                        try:
-                            d['details'] = json.loads(d['details'])
-                        except json.JSONDecodeError:
-                            pass
-                    results.append(d)
-                return results
+        db = self._db
+
+        query = """
+            SELECT id, event_type,
+                datetime(event_time, 'unixepoch') AS event_time,
+                details
+            FROM server_events
+            WHERE server_events.event_time >= ?
+        """
+        params = [_epoch_cutoff(days=days)]
+
+        if event_type:
+            query += " AND event_type = ?"
+            params.append(event_type)
+
+        query += " ORDER BY server_events.event_time DESC"
+
+        async with db.execute(query, tuple(params)) as cursor:
+            results = []
+            for d in await _fetch_dicts(cursor):
+                details = d['details']
+                if details:
+                    try:
+                        d['details'] = _json_loads(details)
+                    except json.JSONDecodeError:
+                        pass
+                results.append(d)
+            return results
 
     async def cleanup_old_server_stats(self, days: int = 365) -> int:
         """
-        Delete server stats older than specified days.
+        Delete raw server stats older than specified days.
+        Hourly aggregates are kept in server_stats_hourly.
         Returns number of deleted rows.
         """
-        async with aiosqlite.connect(self.db_path) as db:
-            cursor = await db.execute(
-                "DELETE FROM server_stats WHERE timestamp < datetime('now', ?)",
-                (f"-{days} days",)
+        return await self._delete_older_than(
+            "server_stats", "timestamp", _epoch_cutoff(days=days)
+        )
+
+    async def _delete_older_than(self, table: str, column: str, cutoff: int) -> int:
+        """
+        Delete rows with column < cutoff in batches of _DELETE_BATCH.
+        Each batch is its own transaction and the lock is released between
+        batches, so collector writes aren't stalled and the WAL stays small.
+        """
+        query = f"""
+            DELETE FROM {table} WHERE rowid IN (
+                SELECT rowid FROM {table} WHERE {column} < ? LIMIT {_DELETE_BATCH}
             )
-            await db.commit()
-            return cursor.rowcount
+        """
+        total = 0
+        while True:
+            async with self._lock:
+                cursor = await self._db.execute(query, (cutoff,))
+                await self._db.commit()
+            total += cursor.rowcount
+            if cursor.rowcount < _DELETE_BATCH:
+                return total
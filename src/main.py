@@ -42,12 +42,15 @@ VPN_HOST = os.getenv("VPN_HOST", "vpn.example.com")
 VPN_PORT = int(os.getenv("VPN_PORT", "51820"))
 VPN_DNS = os.getenv("VPN_DNS", "1.1.1.1")
 STATS_INTERVAL = int(os.getenv("STATS_INTERVAL", "60"))  # seconds
+WAL_CHECKPOINT_INTERVAL = int(os.getenv("WAL_CHECKPOINT_INTERVAL", "3600"))  # seconds
+TRAFFIC_HISTORY_RETENTION_DAYS = int(os.getenv("TRAFFIC_HISTORY_RETENTION_DAYS", "30"))
 
 # Server monitoring configuration
 SERVER_STATS_INTERVAL = int(os.getenv("SERVER_STATS_INTERVAL", "300"))  # 5 min default
 CPU_ALERT_THRESHOLD = float(os.getenv("CPU_ALERT_THRESHOLD", "80"))
 MEM_ALERT_THRESHOLD = float(os.getenv("MEM_ALERT_THRESHOLD", "90"))
 DISK_ALERT_THRESHOLD = float(os.getenv("DISK_ALERT_THRESHOLD", "90"))
+SERVER_STATS_RETENTION_DAYS = int(os.getenv("SERVER_STATS_RETENTION_DAYS", "30"))
 
 
 async def traffic_collector(db: Database, vpn: VPNManager) -> None:
@@ -57,10 +60,28 @@ async def traffic_collector(db: Database, vpn: VPNManager) -> None:
     """
     logger.info(f"Traffic collector started (interval: {STATS_INTERVAL}s)")
 
+    # Truncate the WAL once per WAL_CHECKPOINT_INTERVAL worth of ticks
+    checkpoint_every = max(1, WAL_CHECKPOINT_INTERVAL // STATS_INTERVAL)
+    # Prune raw traffic history once a day (hourly rollup is kept)
+    prune_every = max(1, 86400 // STATS_INTERVAL)
+    tick = 0
+
+    # Clients with an open session; the DB is only touched on transitions
+    active_sessions = await db.get_active_session_client_ids()
+    # (rx, tx) per public key from the previous dump; idle peers are skipped
+    last_counters: dict[str, tuple[int, int]] = {}
+
     while True:
         try:
             await asyncio.sleep(STATS_INTERVAL)
 
+            tick += 1
+            if tick % checkpoint_every == 0:
+                await db.checkpoint()
+            if tick % prune_every == 0:
+                pruned = await db.prune_old_history(TRAFFIC_HISTORY_RETENTION_DAYS)
+                logger.info(f"Pruned {pruned} raw traffic history rows")
+
             # Check if interface is up
             if not await vpn.is_interface_up():
                 logger.debug("VPN interface not up, skipping stats collection")
@@ -73,43 +94,62 @@ async def traffic_collector(db: Database, vpn: VPNManager) -> None:
                 logger.debug("No peer stats available")
                 continue
 
-            # Update database for each peer
+            # Find client for each peer by public key (one query per tick)
+            clients_by_pubkey = await db.get_active_clients_by_pubkey()
+            peers = []
             for peer_stats in stats:
-                # Find client by public key
-                client = await db.get_client_by_public_key(peer_stats.public_key)
+                client = clients_by_pubkey.get(peer_stats.public_key)
                 if client:
-                    delta_rx, delta_tx = await db.update_traffic_counters(
-                        client_id=client.id,
-                        current_received=peer_stats.bytes_received,
-                        current_sent=peer_stats.bytes_sent
+                    peers.append((client, peer_stats))
+
+            # Only peers whose counters moved since the last dump touch the DB
+            changed = [
+                (client, peer_stats) for client, peer_stats in peers
+                if last_counters.get(peer_stats.public_key)
+                != (peer_stats.bytes_received, peer_stats.bytes_sent)
+            ]
+
+            # Update counters of changed peers in one transaction
+            deltas = await db.update_traffic_counters_bulk([
+                (client.id, peer_stats.bytes_received, peer_stats.bytes_sent)
+                for client, peer_stats in changed
+            ])
+            last_counters = {
+                peer_stats.public_key: (peer_stats.bytes_received, peer_stats.bytes_sent)
+                for _, peer_stats in peers
+            }
+
+            for client, peer_stats in peers:
+                delta_rx, delta_tx = deltas.get(client.id, (0, 0))
+                if delta_rx > 0 or delta_tx > 0:
+                    logger.debug(
+                        f"Traffic for {client.name}: "
+                        f"+{delta_rx} bytes RX, +{delta_tx} bytes TX"
                     )
-                    if delta_rx > 0 or delta_tx > 0:
-                        logger.debug(
-                            f"Traffic for {client.name}: "
-                            f"+{delta_rx} bytes RX, +{delta_tx} bytes TX"
-                        )
-                    
-                    # --- Session Tracking ---
-                    now = datetime.now()
-                    handshake_ts = peer_stats.latest_handshake
-                    diff = time.time() - handshake_ts if handshake_ts > 0 else 999999
-                    is_online = diff < 300
+                
+                # --- Session Tracking ---
+                now = datetime.now()
+                handshake_ts = peer_stats.latest_handshake
+                diff = time.time() - handshake_ts if handshake_ts > 0 else 999999
+                is_online = diff < 300
+                
+                logger.debug(f"DEBUG: {client.name} - Handshake: {handshake_ts}, Diff: {diff:.1f}s, Online: {is_online}")
+                
+                active_session = client.id in active_sessions
+                
+                if is_online and not active_session:
+                    # Start new session
+                    start_time = datetime.fromtimestamp(handshake_ts) if handshake_ts > 0 else now
+                    await db.start_session(client.id, start_time)
+                    active_sessions.add(client.id)
+                    logger.info(f"FSM: Session STARTED for {client.name} at {start_time}")
                     
-                    logger.debug(f"DEBUG: {client.name} - Handshake: {handshake_ts}, Diff: {diff:.1f}s, Online: {is_online}")
-                    
-                    active_session = await db.get_active_session(client.id)
-                    
-                    if is_online and not active_session:
-                        # Start new session
-                        start_time = datetime.fromtimestamp(handshake_ts) if handshake_ts > 0 else now
-                        await db.start_session(client.id, start_time)
-                        logger.info(f"FSM: Session STARTED for {client.name} at {start_time}")
-                        
-                    elif not is_online and active_session:
-                        # End current session
-                        end_time = datetime.fromtimestamp(handshake_ts) if handshake_ts > 0 else now
-                        await db.end_session(client.id, end_time)
-                        logger.info(f"FSM: Session ENDED for {client.name} at {end_time}")
+                elif not is_online and active_session:
+                    # End current session
+                    end_time = datetime.fromtimestamp(handshake_ts) if handshake_ts > 0 else now
+                    await db.end_session(client.id, end_time)
+                    active_sessions.discard(client.id)
+                    logger.info(f"FSM: Session ENDED for {client.name} at {end_time}")
 
         except asyncio.CancelledError:
             logger.info("Traffic collector stopped")
@@ -134,10 +174,19 @@ async def server_stats_collector(
     # Record server start event
     await db.record_server_event('start', {'reason': 'bot_startup'})
 
+    # Prune raw samples once a day (hourly rollup is kept)
+    cleanup_every = max(1, 86400 // SERVER_STATS_INTERVAL)
+    tick = 0
+
     while True:
         try:
             await asyncio.sleep(SERVER_STATS_INTERVAL)
 
+            tick += 1
+            if tick % cleanup_every == 0:
+                deleted = await db.cleanup_old_server_stats(SERVER_STATS_RETENTION_DAYS)
+                logger.info(f"Pruned {deleted} raw server stats rows")
+
             # Collect metrics
             metrics = await monitor.collect_metrics_async()
 
@@ -242,15 +291,13 @@ async def main() -> None:
     # Initial Server Sync: Restore state from DB to Config File
     logger.info("Performing initial server synchronization from DB...")
     try:
-        current_clients = await db.get_all_clients()
-        # Convert to dicts for VPNManager
-        clients_dicts = [{"public_key": c.public_key, "address": c.address} for c in current_clients]
+        clients_dicts = await db.get_active_peer_config()
         
         # Rewrite awg0.conf and sync interface
         vpn.update_server_config_file(clients_dicts)
         
         if await vpn.sync_config():
-             logger.info(f"Initial sync successful. {len(current_clients)} peers active.")
+             logger.info(f"Initial sync successful. {len(clients_dicts)} peers active.")
         else:
              logger.error("Initial sync failed!")
              
@@ -284,6 +331,8 @@ async def main() -> None:
         except asyncio.CancelledError:
             pass
         await bot.session.close()
+        # Collectors are stopped, nothing else writes to the database
+        await db.close()
         logger.info("Bot stopped")
 
 
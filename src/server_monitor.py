@@ -5,17 +5,23 @@ Collects CPU, RAM, Disk, Network metrics using psutil.
 
 import asyncio
 import logging
+import os
+import sys
 import time
 from dataclasses import dataclass
 from datetime import datetime
+from functools import lru_cache
 from typing import Optional
 
 import psutil
 
 logger = logging.getLogger(__name__)
 
+# Seconds between disk usage refreshes
+DISK_REFRESH_INTERVAL = 60
 
-@dataclass
+
+@dataclass(slots=True, frozen=True)
 class ServerMetrics:
     """Snapshot of server metrics."""
     timestamp: datetime
@@ -64,57 +70,138 @@ class ServerMonitor:
         self._last_net_recv: int = 0
         self._first_measurement: bool = True
 
-        # Track last alert times to prevent spam
-        self._last_cpu_alert: float = 0
-        self._last_mem_alert: float = 0
-        self._last_disk_alert: float = 0
-
-    def collect_metrics(self) -> ServerMetrics:
-        """Collect current server metrics synchronously."""
-        now = datetime.now()
+        # Track last alert times (monotonic clock) to prevent spam; start one
+        # cooldown in the past so the first alert is never suppressed
+        self._last_cpu_alert: float = -alert_cooldown
+        self._last_mem_alert: float = -alert_cooldown
+        self._last_disk_alert: float = -alert_cooldown
+
+        # CPU count doesn't change; disk usage is refreshed at most once
+        # per DISK_REFRESH_INTERVAL seconds (monotonic clock)
+        self._cpu_count: int = psutil.cpu_count() or 1
+        self._disk_usage = None
+        self._disk_usage_ts: float = 0.0
+
+        # On Linux, CPU/memory/network/load are read straight from /proc in
+        # one pass; psutil remains the fallback elsewhere or if parsing fails
+        self._use_proc: bool = sys.platform.startswith('linux') and os.path.exists('/proc/stat')
+        self._last_cpu_busy: int = 0
+        self._last_cpu_total: int = 0
+
+    def _read_proc(self) -> tuple:
+        """
+        Read CPU %, memory, network totals and load average from /proc.
+        Values match what the psutil calls in _read_psutil return.
+        """
+        # CPU: guest time is already included in user/nice, so it is skipped
+        with open('/proc/stat') as f:
+            fields = f.readline().split()[1:9]
+        times = [int(x) for x in fields]
+        total = sum(times)
+        busy = total - times[3] - times[4]  # minus idle and iowait
+        busy_delta = busy - self._last_cpu_busy
+        total_delta = total - self._last_cpu_total
+        if self._last_cpu_total and busy_delta > 0 and total_delta > 0:
+            cpu_percent = round(min(100.0, busy_delta / total_delta * 100), 1)
+        else:
+            cpu_percent = 0.0
+        self._last_cpu_busy = busy
+        self._last_cpu_total = total
+
+        # Memory (kB values)
+        meminfo = {}
+        with open('/proc/meminfo') as f:
+            for line in f:
+                key, value = line.split(':', 1)
+                meminfo[key] = int(value.split()[0]) * 1024
+        mem_total = meminfo['MemTotal']
+        mem_free = meminfo['MemFree']
+        cached = meminfo['Cached'] + meminfo.get('SReclaimable', 0)
+        mem_used = mem_total - mem_free - cached - meminfo.get('Buffers', 0)
+        if mem_used < 0:
+            mem_used = mem_total - mem_free
+        mem_percent = round((mem_total - meminfo['MemAvailable']) / mem_total * 100, 1)
+
+        # Network: sum of all interfaces, like psutil.net_io_counters()
+        net_recv = net_sent = 0
+        with open('/proc/net/dev') as f:
+            for line in f.readlines()[2:]:
+                counters = line.split(':', 1)[1].split()
+                net_recv += int(counters[0])
+                net_sent += int(counters[8])
+
+        with open('/proc/loadavg') as f:
+            load_1m, load_5m, load_15m = (float(x) for x in f.read().split()[:3])
+
+        return (
+            cpu_percent, mem_total, mem_used, mem_percent,
+            net_sent, net_recv, load_1m, load_5m, load_15m,
+        )
 
+    def _read_psutil(self) -> tuple:
+        """Read the same values as _read_proc through psutil."""
         # CPU (interval=0 for non-blocking)
         cpu_percent = psutil.cpu_percent(interval=0)
-        cpu_count = psutil.cpu_count() or 1
-
-        # Memory
         mem = psutil.virtual_memory()
+        net = psutil.net_io_counters()
+
+        # Load average (Linux/macOS only)
+        try:
+            load_1m, load_5m, load_15m = psutil.getloadavg()
+        except (AttributeError, OSError):
+            load_1m = load_5m = load_15m = None
+
+        return (
+            cpu_percent, mem.total, mem.used, mem.percent,
+            net.bytes_sent, net.bytes_recv, load_1m, load_5m, load_15m,
+        )
+
+    def collect_metrics(self) -> ServerMetrics:
+        """Collect current server metrics synchronously."""
+        now = datetime.now()
 
-        # Disk (root partition)
-        disk = psutil.disk_usage('/')
+        if self._use_proc:
+            try:
+                values = self._read_proc()
+            except (OSError, ValueError, KeyError, IndexError) as e:
+                logger.warning(f"Failed to read /proc, falling back to psutil: {e}")
+                self._use_proc = False
+        if not self._use_proc:
+            values = self._read_psutil()
+        (
+            cpu_percent, mem_total, mem_used, mem_percent,
+            net_bytes_sent, net_bytes_recv, load_1m, load_5m, load_15m,
+        ) = values
+
+        # Disk (root partition), changes slowly
+        now_mono = time.monotonic()
+        if self._disk_usage is None or now_mono - self._disk_usage_ts >= DISK_REFRESH_INTERVAL:
+            self._disk_usage = psutil.disk_usage('/')
+            self._disk_usage_ts = now_mono
+        disk = self._disk_usage
 
         # Network - calculate deltas
-        net = psutil.net_io_counters()
         if self._first_measurement:
             net_delta_sent = 0
             net_delta_recv = 0
             self._first_measurement = False
         else:
-            net_delta_sent = net.bytes_sent - self._last_net_sent
-            net_delta_recv = net.bytes_recv - self._last_net_recv
-            # Handle counter reset
-            if net_delta_sent < 0:
-                net_delta_sent = net.bytes_sent
-            if net_delta_recv < 0:
-                net_delta_recv = net.bytes_recv
+            # A counter lower than last time was reset; count from zero
+            last_sent = self._last_net_sent
+            last_recv = self._last_net_recv
+            net_delta_sent = net_bytes_sent if net_bytes_sent < last_sent else net_bytes_sent - last_sent
+            net_delta_recv = net_bytes_recv if net_bytes_recv < last_recv else net_bytes_recv - last_recv
 
-        self._last_net_sent = net.bytes_sent
-        self._last_net_recv = net.bytes_recv
-
-        # Load average (Linux/macOS only)
-        try:
-            load = psutil.getloadavg()
-            load_1m, load_5m, load_15m = load
-        except (AttributeError, OSError):
-            load_1m = load_5m = load_15m = None
+        self._last_net_sent = net_bytes_sent
+        self._last_net_recv = net_bytes_recv
 
         return ServerMetrics(
             timestamp=now,
             cpu_percent=cpu_percent,
-            cpu_count=cpu_count,
-            mem_total=mem.total,
-            mem_used=mem.used,
-            mem_percent=mem.percent,
+            cpu_count=self._cpu_count,
+            mem_total=mem_total,
+            mem_used=mem_used,
+            mem_percent=mem_percent,
             disk_total=disk.total,
             disk_used=disk.used,
             disk_percent=disk.percent,
@@ -126,9 +213,8 @@ class ServerMonitor:
         )
 
     async def collect_metrics_async(self) -> ServerMetrics:
-        """Async wrapper - runs blocking psutil in executor."""
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(None, self.collect_metrics)
+        """Async wrapper - runs blocking psutil in a worker thread."""
+        return await asyncio.to_thread(self.collect_metrics)
 
     def check_alerts(self, metrics: ServerMetrics) -> list[dict]:
         """
@@ -136,7 +222,8 @@ class ServerMonitor:
         Returns list of alert dicts with 'type', 'value', 'threshold' keys.
         Respects cooldown period to prevent alert spam.
         """
-        now = time.time()
+        # Monotonic, so wall clock changes can't shorten or stretch cooldowns
+        now = time.monotonic()
         alerts = []
 
         # CPU Alert
@@ -172,14 +259,20 @@ class ServerMonitor:
         return alerts
 
 
+@lru_cache(maxsize=1)
+def _boot_time() -> float:
+    """System boot time; constant for the life of the process."""
+    return psutil.boot_time()
+
+
 def get_uptime_info() -> dict:
     """Get system boot time and uptime."""
-    boot_time = psutil.boot_time()
+    boot_time = _boot_time()
     uptime_seconds = time.time() - boot_time
 
-    days = int(uptime_seconds // 86400)
-    hours = int((uptime_seconds % 86400) // 3600)
-    minutes = int((uptime_seconds % 3600) // 60)
+    days, rem = divmod(int(uptime_seconds), 86400)
+    hours, rem = divmod(rem, 3600)
+    minutes = rem // 60
 
     return {
         'boot_time': datetime.fromtimestamp(boot_time),
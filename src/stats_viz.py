@@ -1,33 +1,217 @@
 """
 Statistics visualization module.
-Generates traffic charts using matplotlib.
+Generates traffic charts using matplotlib (Pillow for the simple bar profiles).
 """
 
+import hashlib
 import io
+import json
 import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, fields
+from functools import lru_cache, wraps
+from operator import itemgetter
 from typing import Optional
 
-import matplotlib
-matplotlib.use('Agg')  # Non-interactive backend for server use
-import matplotlib.pyplot as plt
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
+CHART_DPI = 100
+
+# matplotlib is imported on first chart render; text-only helpers such as
+# format_size and generate_stats_summary never pay for it. Figures are
+# built on their own Agg canvas, bypassing pyplot's global figure manager.
+_mpl = None
+_mpl_lock = threading.Lock()
+
+
+def _lazy_matplotlib():
+    """Import and configure matplotlib on first use; returns (Figure, FigureCanvasAgg)."""
+    global _mpl
+    if _mpl is not None:
+        return _mpl
+    # Charts may render from several worker threads; rcParams are set only once
+    with _mpl_lock:
+        if _mpl is not None:
+            return _mpl
+        import matplotlib
+        import matplotlib.style
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        # Dark theme for better Telegram visibility, applied once for all charts;
+        # text is already white, so only grid and background are set here
+        matplotlib.style.use('dark_background')
+        matplotlib.rcParams.update({
+            'axes.grid': True,
+            'grid.linestyle': '--',
+            'grid.alpha': 0.3,
+            'figure.facecolor': '#1a1a1a',
+            'figure.edgecolor': 'none',
+        })
+        _mpl = (Figure, FigureCanvasAgg)
+        return _mpl
+
+
+# Per-thread pool of figures keyed by figsize; creating a figure and its
+# Agg canvas costs more than rendering a small chart, so they are reused
+_figure_pool = threading.local()
+
+
+def _get_pooled_fig(figsize: tuple[int, int]):
+    """Take a cleared (fig, ax) of the given size from the pool, or create one."""
+    pool = getattr(_figure_pool, 'figures', None)
+    if pool is None:
+        pool = _figure_pool.figures = {}
+    fig = pool.pop(figsize, None)
+    if fig is None:
+        Figure, FigureCanvasAgg = _lazy_matplotlib()
+        fig = Figure(figsize=figsize, dpi=CHART_DPI)
+        FigureCanvasAgg(fig)  # attaches itself as fig.canvas
+        # Tight layout is applied on every draw, so charts need not call it
+        fig.set_layout_engine('tight')
+        return fig, fig.add_subplot()
+    ax = fig.axes[0]
+    ax.clear()
+    # clear() keeps whatever axisbelow the previous chart set
+    import matplotlib
+    ax.set_axisbelow(matplotlib.rcParams['axes.axisbelow'])
+    return fig, ax
+
+
+def _return_pooled_fig(figsize: tuple[int, int], fig) -> None:
+    """Put a figure back into the pool once its image has been saved."""
+    pool = getattr(_figure_pool, 'figures', None)
+    if pool is None:
+        pool = _figure_pool.figures = {}
+    # Figures outside pyplot need no close(); a surplus one is just dropped
+    pool.setdefault(figsize, fig)
+
+
+@lru_cache(maxsize=1)
+def _chart_format() -> tuple[str, dict]:
+    """WebP when Pillow was built with it, JPEG otherwise."""
+    from PIL import features
+    if features.check('webp'):
+        return 'webp', {'quality': 85, 'method': 4}
+    return 'jpeg', {'quality': 88}
+
+
+def chart_extension() -> str:
+    """File extension matching the format charts are rendered in."""
+    fmt, _ = _chart_format()
+    return '.webp' if fmt == 'webp' else '.jpg'
+
+
+def _figure_bytes(fig) -> bytes:
+    """Encode a finished figure in the chart format."""
+    fmt, pil_kwargs = _chart_format()
+    buf = io.BytesIO()
+    # Straight to the canvas's encoder; dpi and facecolor are set on the figure
+    getattr(fig.canvas, f'print_{fmt}')(buf, pil_kwargs=pil_kwargs)
+    return buf.getvalue()
+
+
+def _lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets downsampling.
+    Returns indices of n_out points that keep the visual shape (peaks
+    included) of the series; first and last points are always kept.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    every = (n - 2) / (n_out - 2)
+    indices = np.empty(n_out, dtype=np.intp)
+    indices[0] = 0
+    indices[-1] = n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        # Average of the next bucket (the last point for the final bucket)
+        next_end = min(max(int((i + 2) * every) + 1, end + 1), n)
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+
+        xs = x[start:end]
+        ys = y[start:end]
+        area = np.abs((x[a] - avg_x) * (ys - y[a]) - (x[a] - xs) * (avg_y - y[a]))
+        a = start + int(area.argmax())
+        indices[i + 1] = a
+    return indices
+
+
+def _downsample_lines(timestamps, lines: list, width_px: int) -> list:
+    """
+    Reduce each values array in lines to about one point per pixel column
+    with LTTB when there are far more points than pixels.
+    Returns a list of (timestamps, values) pairs, one per input array.
+    """
+    if len(timestamps) <= 2 * width_px:
+        return [(timestamps, values) for values in lines]
+
+    timestamps = np.asarray(timestamps, dtype='datetime64[s]')
+    x = timestamps.astype(np.int64).astype(np.float64)
+    sampled = []
+    for values in lines:
+        values = np.asarray(values)
+        idx = _lttb_indices(x, values.astype(np.float64), width_px)
+        sampled.append((timestamps[idx], values[idx]))
+    return sampled
+
+
+# Recently rendered charts keyed by a digest of (chart, data, title), so
+# repeated requests for the same stats skip rendering and encoding
+_CHART_CACHE_SIZE = 32
+_chart_cache: "OrderedDict[bytes, bytes]" = OrderedDict()
+_chart_cache_lock = threading.Lock()
+
+
+def _cached_chart(func):
+    """Memoize a chart generator on its (JSON-serializable) data and title."""
+    @wraps(func)
+    def wrapper(data, title=None):
+        args = (data,) if title is None else (data, title)
+        try:
+            payload = json.dumps([func.__name__, data, title], sort_keys=True, default=str)
+        except (TypeError, ValueError):
+            return func(*args)
+        key = hashlib.blake2b(payload.encode(), digest_size=16).digest()
+
+        with _chart_cache_lock:
+            image = _chart_cache.get(key)
+            if image is not None:
+                _chart_cache.move_to_end(key)
+                return image
+
+        image = func(*args)
+        if image is not None:
+            with _chart_cache_lock:
+                _chart_cache[key] = image
+                if len(_chart_cache) > _CHART_CACHE_SIZE:
+                    _chart_cache.popitem(last=False)
+        return image
+    return wrapper
 
-def bytes_to_gb(bytes_count: int) -> float:
-    """Convert bytes to gigabytes."""
-    return bytes_count / (1024 ** 3)
+
+_SIZE_UNITS = ("B", "KB", "MB", "GB", "TB", "PB")
 
 
 def format_size(bytes_count: int) -> str:
     """Format bytes to human-readable string."""
-    for unit in ["B", "KB", "MB", "GB", "TB"]:
-        if bytes_count < 1024:
-            return f"{bytes_count:.2f} {unit}"
-        bytes_count /= 1024
-    return f"{bytes_count:.2f} PB"
+    # Also covers zero, negative and fractional counts, as the old loop did
+    if bytes_count < 1024:
+        return f"{bytes_count:.2f} B"
+    # Unit index straight from the bit length: every 10 bits is one step of 1024
+    i = min(int(bytes_count).bit_length() - 1, 59) // 10
+    return f"{bytes_count / (1 << (10 * i)):.2f} {_SIZE_UNITS[i]}"
 
 
+@_cached_chart
 def generate_traffic_chart(
     traffic_data: dict[str, tuple[int, int]],
     title: str = "VPN Traffic by Client"
@@ -40,7 +224,7 @@ def generate_traffic_chart(
         title: Chart title
 
     Returns:
-        PNG image as bytes, or None if no data
+        Chart image (WebP or JPEG) as bytes, or None if no data
     """
     if not traffic_data:
         logger.warning("No traffic data to visualize")
@@ -50,20 +234,23 @@ def generate_traffic_chart(
     # Note: traffic_data is (bytes_received_by_server, bytes_sent_by_server)
     # From client perspective: received_by_server = uploaded, sent_by_server = downloaded
     clients = list(traffic_data.keys())
-    uploaded = [bytes_to_gb(traffic_data[c][0]) for c in clients]
-    downloaded = [bytes_to_gb(traffic_data[c][1]) for c in clients]
+    n = len(clients)
+    uploaded = np.fromiter(
+        (traffic_data[c][0] for c in clients), dtype=np.float64, count=n
+    ) * (1.0 / (1024 ** 3))
+    downloaded = np.fromiter(
+        (traffic_data[c][1] for c in clients), dtype=np.float64, count=n
+    ) * (1.0 / (1024 ** 3))
 
-    # Create figure with dark theme for better Telegram visibility
-    plt.style.use('dark_background')
-    fig, ax = plt.subplots(figsize=(10, 6))
+    fig, ax = _get_pooled_fig((10, 6))
 
     # Bar positions
-    x = range(len(clients))
+    x = np.arange(n)
     width = 0.35
 
     # Create bars
     bars1 = ax.bar(
-        [i - width/2 for i in x],
+        x - width/2,
         downloaded,
         width,
         label='Downloaded',
@@ -71,7 +258,7 @@ def generate_traffic_chart(
         alpha=0.8
     )
     bars2 = ax.bar(
-        [i + width/2 for i in x],
+        x + width/2,
         uploaded,
         width,
         label='Uploaded',
@@ -79,47 +266,33 @@ def generate_traffic_chart(
         alpha=0.8
     )
 
-    # Add value labels on bars
-    def add_labels(bars):
-        for bar in bars:
-            height = bar.get_height()
-            if height > 0:
-                ax.annotate(
-                    f'{height:.2f}',
-                    xy=(bar.get_x() + bar.get_width() / 2, height),
-                    xytext=(0, 3),
-                    textcoords="offset points",
-                    ha='center',
-                    va='bottom',
-                    fontsize=9,
-                    color='white'
-                )
-
-    add_labels(bars1)
-    add_labels(bars2)
+    # Add value labels on bars (empty bars stay unlabelled)
+    for bars, values in ((bars1, downloaded), (bars2, uploaded)):
+        if values.max() > 0:
+            ax.bar_label(
+                bars,
+                labels=[f'{v:.2f}' if v > 0 else '' for v in values],
+                padding=3,
+                fontsize=9,
+            )
 
     # Customize chart
-    ax.set_xlabel('Client', fontsize=12, color='white')
-    ax.set_ylabel('Traffic (GB)', fontsize=12, color='white')
-    ax.set_title(title, fontsize=14, fontweight='bold', color='white')
+    ax.set_xlabel('Client', fontsize=12)
+    ax.set_ylabel('Traffic (GB)', fontsize=12)
+    ax.set_title(title, fontsize=14, fontweight='bold')
     ax.set_xticks(x)
     ax.set_xticklabels(clients, rotation=45, ha='right', fontsize=10)
     ax.legend(loc='upper right', fontsize=10)
 
-    # Add grid for readability
-    ax.yaxis.grid(True, linestyle='--', alpha=0.3)
+    # Horizontal grid only, behind the bars
+    ax.xaxis.grid(False)
     ax.set_axisbelow(True)
 
-    # Adjust layout
-    plt.tight_layout()
-
     # Save to bytes
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png', dpi=150, facecolor='#1a1a1a', edgecolor='none')
-    buf.seek(0)
-    plt.close(fig)
+    image = _figure_bytes(fig)
+    _return_pooled_fig((10, 6), fig)
 
-    return buf.getvalue()
+    return image
 
 
 def generate_stats_summary(traffic_data: dict[str, tuple[int, int]]) -> str:
@@ -137,8 +310,13 @@ def generate_stats_summary(traffic_data: dict[str, tuple[int, int]]) -> str:
 
     # Note: traffic_data is (bytes_received_by_server, bytes_sent_by_server)
     # From client perspective: received_by_server = uploaded, sent_by_server = downloaded
-    total_uploaded = sum(t[0] for t in traffic_data.values())
-    total_downloaded = sum(t[1] for t in traffic_data.values())
+    # One pass: per-client totals and the grand totals
+    items = []
+    total_uploaded = total_downloaded = 0
+    for name, (server_rx, server_tx) in traffic_data.items():
+        items.append((name, server_rx, server_tx, server_rx + server_tx))
+        total_uploaded += server_rx
+        total_downloaded += server_tx
     total_traffic = total_uploaded + total_downloaded
 
     lines = [
@@ -153,20 +331,16 @@ def generate_stats_summary(traffic_data: dict[str, tuple[int, int]]) -> str:
     ]
 
     # Sort by total traffic
-    sorted_clients = sorted(
-        traffic_data.items(),
-        key=lambda x: x[1][0] + x[1][1],
-        reverse=True
-    )
+    items.sort(key=itemgetter(3), reverse=True)
 
-    for i, (name, (server_rx, server_tx)) in enumerate(sorted_clients, 1):
+    for i, (name, server_rx, server_tx, total) in enumerate(items, 1):
         # server_rx = uploaded by client, server_tx = downloaded by client
-        total = server_rx + server_tx
         lines.append(f"{i}. **{name}**: {format_size(total)} (↓{format_size(server_tx)} / ↑{format_size(server_rx)})")
 
     return "\n".join(lines)
 
 
+@_cached_chart
 def generate_series_chart(data: list[dict], title: str = "Traffic History (24h)") -> Optional[bytes]:
     """Generate time series line chart."""
     if not data:
@@ -176,384 +350,374 @@ def generate_series_chart(data: list[dict], title: str = "Traffic History (24h)"
     # Note: rx/tx from DB is server perspective
     # rx (received by server) = uploaded by client
     # tx (sent by server) = downloaded by client
-    from datetime import datetime
-    timestamps = [datetime.strptime(d['ts'], "%Y-%m-%d %H:%M:%S") for d in data]
-    uploaded = [bytes_to_gb(d['rx']) for d in data]
-    downloaded = [bytes_to_gb(d['tx']) for d in data]
+    timestamps = np.asarray([d['ts'] for d in data], dtype='datetime64[s]')
+    n = len(data)
+    uploaded = np.fromiter((d['rx'] for d in data), dtype=np.float64, count=n) * (1.0 / (1024 ** 3))
+    downloaded = np.fromiter((d['tx'] for d in data), dtype=np.float64, count=n) * (1.0 / (1024 ** 3))
+
+    # Long ranges (e.g. 7 days per minute) are downsampled to the pixel width
+    (ts_down, downloaded), (ts_up, uploaded) = _downsample_lines(
+        timestamps, [downloaded, uploaded], 10 * CHART_DPI
+    )
 
-    plt.style.use('dark_background')
-    fig, ax = plt.subplots(figsize=(10, 6))
+    fig, ax = _get_pooled_fig((10, 6))
 
-    ax.plot(timestamps, downloaded, label='Downloaded', color='#4CAF50', linewidth=2)
-    ax.plot(timestamps, uploaded, label='Uploaded', color='#2196F3', linewidth=2)
+    ax.plot(ts_down, downloaded, label='Downloaded', color='#4CAF50', linewidth=2)
+    ax.plot(ts_up, uploaded, label='Uploaded', color='#2196F3', linewidth=2)
 
     # Fill area under curve
-    ax.fill_between(timestamps, downloaded, alpha=0.3, color='#4CAF50')
-    ax.fill_between(timestamps, uploaded, alpha=0.3, color='#2196F3')
+    ax.fill_between(ts_down, downloaded, alpha=0.3, color='#4CAF50')
+    ax.fill_between(ts_up, uploaded, alpha=0.3, color='#2196F3')
 
-    ax.set_title(title, fontsize=14, fontweight='bold', color='white')
-    ax.set_ylabel('Traffic (GB)', fontsize=12, color='white')
-    ax.grid(True, linestyle='--', alpha=0.3)
+    ax.set_title(title, fontsize=14, fontweight='bold')
+    ax.set_ylabel('Traffic (GB)', fontsize=12)
     ax.legend()
     
     # Format x-axis dates
     fig.autofmt_xdate()
 
-    plt.tight_layout()
+    image = _figure_bytes(fig)
+    _return_pooled_fig((10, 6), fig)
+    return image
+
+
+# Hourly and weekly profiles are a single series of at most 24 bars, so
+# they are drawn straight onto a Pillow canvas in the same dark style
+# instead of going through matplotlib's text layout and ticker machinery.
+_BAR_CHART_SIZE = (1000, 600)
+_BAR_CHART_MARGINS = (80, 40, 15, 62)  # left, top, right, bottom
+_BAR_CHART_BG = (26, 26, 26)
+_BAR_CHART_GRID = (77, 77, 77)
+
+
+@lru_cache(maxsize=None)
+def _pil_font(size: int):
+    from PIL import ImageFont
+    return ImageFont.load_default(size=size)
+
+
+def _nice_ticks(vmax: float, max_ticks: int = 8) -> tuple[list[float], int]:
+    """Round y-axis ticks from 0 covering vmax, and the decimals to show."""
+    if vmax <= 0:
+        vmax = 1.0
+    raw = vmax / max_ticks
+    exp = np.floor(np.log10(raw))
+    base = 10.0 ** exp
+    for m in (1, 2, 2.5, 5, 10):
+        if m * base >= raw:
+            step = m * base
+            break
+    decimals = max(0, int(-exp)) + (1 if m == 2.5 else 0)
+    count = int(np.floor(vmax / step + 1e-9)) + 1
+    return [i * step for i in range(count)], decimals
+
+
+def _render_bar_chart(
+    labels: list[str],
+    values: np.ndarray,
+    color: str,
+    title: str,
+    ylabel: str,
+    xlabel: Optional[str] = None,
+) -> bytes:
+    """Draw a single-series bar chart with Pillow and encode it in the chart format."""
+    from PIL import Image, ImageColor, ImageDraw
+
+    width, height = _BAR_CHART_SIZE
+    left, top, right, bottom = _BAR_CHART_MARGINS
+    if xlabel is None:
+        bottom -= 22
+    x0, y0, x1, y1 = left, top, width - right, height - bottom
+    plot_w, plot_h = x1 - x0, y1 - y0
+
+    img = Image.new('RGB', (width, height), _BAR_CHART_BG)
+    draw = ImageDraw.Draw(img)
+    draw.rectangle((x0, y0, x1, y1), fill=(0, 0, 0))
+
+    # Same 5% headroom matplotlib leaves above the tallest bar
+    vmax = float(values.max()) if len(values) else 0.0
+    ticks, decimals = _nice_ticks(vmax)
+    ymax = max(vmax * 1.05, ticks[-1]) if vmax > 0 else ticks[-1]
+    tick_font = _pil_font(13)
+
+    def y_of(v: float) -> float:
+        return y1 - plot_h * v / ymax
+
+    for t in ticks:
+        y = round(y_of(t))
+        for xs in range(x0, x1, 9):
+            draw.line((xs, y, min(xs + 5, x1), y), fill=_BAR_CHART_GRID)
+        draw.line((x0 - 4, y, x0, y), fill='white')
+        draw.text((x0 - 7, y), f'{t:.{decimals}f}', fill='white', font=tick_font, anchor='rm')
+
+    # Bars at 80% of their slot, blended over black like alpha=0.8
+    slot = plot_w / len(labels)
+    r, g, b = ImageColor.getrgb(color)
+    fill = (int(r * 0.8), int(g * 0.8), int(b * 0.8))
+    for i, (label, v) in enumerate(zip(labels, values.tolist())):
+        cx = x0 + slot * (i + 0.5)
+        if v > 0:
+            draw.rectangle((round(cx - slot * 0.4), round(y_of(v)), round(cx + slot * 0.4), y1), fill=fill)
+        draw.line((round(cx), y1, round(cx), y1 + 4), fill='white')
+        draw.text((cx, y1 + 7), label, fill='white', font=tick_font, anchor='mt')
+
+    draw.rectangle((x0, y0, x1, y1), outline='white')
+    draw.text(((x0 + x1) / 2, y0 - 8), title, fill='white', font=_pil_font(19), anchor='md')
+    if xlabel:
+        draw.text(((x0 + x1) / 2, height - 10), xlabel, fill='white', font=_pil_font(17), anchor='md')
+
+    # Y label is drawn on its own strip and rotated into place
+    label_font = _pil_font(17)
+    lw = int(draw.textlength(ylabel, font=label_font)) + 4
+    strip = Image.new('RGB', (lw, 24), _BAR_CHART_BG)
+    ImageDraw.Draw(strip).text((lw / 2, 12), ylabel, fill='white', font=label_font, anchor='mm')
+    strip = strip.rotate(90, expand=True)
+    img.paste(strip, (14, round((y0 + y1 - lw) / 2)))
+
+    fmt, pil_kwargs = _chart_format()
     buf = io.BytesIO()
-    plt.savefig(buf, format='png', dpi=150, facecolor='#1a1a1a', edgecolor='none')
-    buf.seek(0)
-    plt.close(fig)
+    img.save(buf, fmt, **pil_kwargs)
     return buf.getvalue()
 
 
+@_cached_chart
 def generate_hourly_chart(data: list[dict], title: str = "Hourly Activity Profile") -> Optional[bytes]:
     """Generate bar chart of traffic by hour of day (0-23)."""
     if not data:
         return None
 
-    # Prepare 24 hours
-    hours = list(range(24))
-    values = [0] * 24
-    
+    values = np.zeros(24)
+
     for d in data:
         h = d['hour']
         if 0 <= h < 24:
             # We use total_bytes here as it represents load
-            values[h] = bytes_to_gb(d['total_bytes'])
-
-    plt.style.use('dark_background')
-    fig, ax = plt.subplots(figsize=(10, 6))
-
-    ax.bar(hours, values, color='#FFC107', alpha=0.8)
+            values[h] = d['total_bytes']
+    values *= 1.0 / (1024 ** 3)
 
-    ax.set_title(title, fontsize=14, fontweight='bold', color='white')
-    ax.set_xlabel('Hour of Day (0-23)', fontsize=12, color='white')
-    ax.set_ylabel('Total Traffic (GB)', fontsize=12, color='white')
-    ax.set_xticks(hours)
-    ax.grid(axis='y', linestyle='--', alpha=0.3)
-
-    plt.tight_layout()
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png', dpi=150, facecolor='#1a1a1a', edgecolor='none')
-    buf.seek(0)
-    plt.close(fig)
-    return buf.getvalue()
+    return _render_bar_chart(
+        [str(h) for h in range(24)], values, '#FFC107', title,
+        ylabel='Total Traffic (GB)', xlabel='Hour of Day (0-23)',
+    )
 
 
+@_cached_chart
 def generate_weekly_chart(data: list[dict], title: str = "Weekly Activity Profile") -> Optional[bytes]:
     """Generate bar chart of traffic by day of week."""
     if not data:
         return None
 
     days = ["Sun", "Mon", "Tue", "Wed", "Thu", "Fri", "Sat"]
-    values = [0] * 7
+    values = np.zeros(7)
 
     for d in data:
         w = d['weekday']
         if 0 <= w < 7:
-            values[w] = bytes_to_gb(d['total_bytes'])
-
-    plt.style.use('dark_background')
-    fig, ax = plt.subplots(figsize=(10, 6))
-
-    ax.bar(days, values, color='#9C27B0', alpha=0.8)
+            values[w] = d['total_bytes']
+    values *= 1.0 / (1024 ** 3)
 
-    ax.set_title(title, fontsize=14, fontweight='bold', color='white')
-    ax.set_ylabel('Total Traffic (GB)', fontsize=12, color='white')
-    ax.grid(axis='y', linestyle='--', alpha=0.3)
-
-    plt.tight_layout()
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png', dpi=150, facecolor='#1a1a1a', edgecolor='none')
-    buf.seek(0)
-    plt.close(fig)
-    return buf.getvalue()
+    return _render_bar_chart(days, values, '#9C27B0', title, ylabel='Total Traffic (GB)')
 
 
 # --- Server Monitoring Charts ---
 
-def generate_server_cpu_chart(data: list[dict], title: str = "CPU Usage") -> Optional[bytes]:
-    """Generate CPU usage time series chart."""
-    if not data:
-        return None
-
-    from datetime import datetime
-
-    timestamps = []
-    cpu_values = []
-    for d in data:
+@dataclass(slots=True)
+class MetricsSeries:
+    """Server stats series stored column-wise, one array per metric."""
+    timestamps: np.ndarray  # datetime64[s]
+    cpu: np.ndarray         # float32
+    mem: np.ndarray         # float32
+    disk: np.ndarray        # float32
+    net_sent: np.ndarray    # int64
+    net_recv: np.ndarray    # int64
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    @classmethod
+    def from_rows(cls, data: list[dict]) -> "MetricsSeries":
+        """
+        Build a series from server stats rows as returned by the database.
+        Malformed rows (missing keys, NULL or unparseable values) are skipped.
+        """
         try:
-            ts = d['timestamp']
-            if isinstance(ts, str):
-                # Try different formats
-                for fmt in ["%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:00", "%Y-%m-%d"]:
-                    try:
-                        timestamps.append(datetime.strptime(ts, fmt))
-                        break
-                    except ValueError:
-                        continue
-                else:
-                    timestamps.append(datetime.fromisoformat(ts))
-            else:
-                timestamps.append(ts)
-            cpu_values.append(d['cpu_percent'])
-        except Exception as e:
-            logger.warning(f"Failed to parse data point: {e}")
-            continue
-
-    if not timestamps:
+            series = cls._convert(data)
+        except (KeyError, TypeError, ValueError) as e:
+            # Only pay for per-row checks when the fast conversion fails
+            valid = [d for d in data if _is_valid_row(d)]
+            logger.warning(f"Skipped {len(data) - len(valid)} malformed data points: {e}")
+            series = cls._convert(valid)
+
+        # NULL timestamps convert to NaT instead of raising
+        keep = ~np.isnat(series.timestamps)
+        if not keep.all():
+            logger.warning(f"Skipped {len(keep) - int(keep.sum())} data points without a timestamp")
+            series = cls(**{f.name: getattr(series, f.name)[keep] for f in fields(cls)})
+        return series
+
+    @classmethod
+    def _convert(cls, data: list[dict]) -> "MetricsSeries":
+        n = len(data)
+        return cls(
+            timestamps=np.asarray([d['timestamp'] for d in data], dtype='datetime64[s]'),
+            cpu=np.fromiter((d['cpu_percent'] for d in data), dtype=np.float32, count=n),
+            mem=np.fromiter((d['mem_percent'] for d in data), dtype=np.float32, count=n),
+            disk=np.fromiter((d['disk_percent'] for d in data), dtype=np.float32, count=n),
+            net_sent=np.fromiter((d['net_bytes_sent'] for d in data), dtype=np.int64, count=n),
+            net_recv=np.fromiter((d['net_bytes_recv'] for d in data), dtype=np.int64, count=n),
+        )
+
+
+def _is_valid_row(d: dict) -> bool:
+    """Whether a server stats row converts cleanly into a MetricsSeries."""
+    try:
+        np.datetime64(d['timestamp'], 's')
+        for key in ('cpu_percent', 'mem_percent', 'disk_percent'):
+            float(d[key])
+        for key in ('net_bytes_sent', 'net_bytes_recv'):
+            int(d[key])
+    except (KeyError, TypeError, ValueError):
+        return False
+    return True
+
+
+def _as_series(data: "list[dict] | MetricsSeries") -> Optional[MetricsSeries]:
+    """Accept either a MetricsSeries or raw rows; None if no row is usable."""
+    if isinstance(data, MetricsSeries):
+        return data
+    series = MetricsSeries.from_rows(data)
+    return series if len(series) else None
+
+
+def _render_server_series(
+    timestamps,
+    lines: list[tuple[object, str, str]],
+    *,
+    ylabel: str,
+    title: str,
+    threshold: Optional[float] = None,
+    ylim: Optional[tuple[float, float]] = (0, 100),
+    fill: bool = True,
+    figsize: tuple[int, int] = (10, 6),
+) -> Optional[bytes]:
+    """
+    Render server metric arrays as a time series chart.
+    lines: list of (values, color, label) tuples, plotted in order.
+    """
+    n = len(timestamps)
+    if not n:
         return None
 
-    plt.style.use('dark_background')
-    fig, ax = plt.subplots(figsize=(10, 6))
+    # Dense series are downsampled to the pixel width; thresholds and stored
+    # data are unaffected
+    sampled = _downsample_lines(timestamps, [line[0] for line in lines], figsize[0] * CHART_DPI)
+
+    fig, ax = _get_pooled_fig(figsize)
 
-    ax.plot(timestamps, cpu_values, color='#FF5722', linewidth=2, label='CPU %')
-    ax.fill_between(timestamps, cpu_values, alpha=0.3, color='#FF5722')
+    for (ts, values), (_, color, label) in zip(sampled, lines):
+        ax.plot(ts, values, color=color, linewidth=2, label=label)
+        if fill:
+            ax.fill_between(ts, values, alpha=0.3, color=color)
 
-    # Add threshold line
-    ax.axhline(y=80, color='#F44336', linestyle='--', alpha=0.7, label='Alert (80%)')
+    if threshold is not None:
+        ax.axhline(y=threshold, color='#F44336', linestyle='--', alpha=0.7, label=f'Alert ({threshold:g}%)')
 
-    ax.set_title(title, fontsize=14, fontweight='bold', color='white')
-    ax.set_ylabel('CPU Usage (%)', fontsize=12, color='white')
-    ax.set_ylim(0, 100)
-    ax.grid(True, linestyle='--', alpha=0.3)
+    ax.set_title(title, fontsize=14, fontweight='bold')
+    ax.set_ylabel(ylabel, fontsize=12)
+    if ylim is not None:
+        ax.set_ylim(*ylim)
     ax.legend(loc='upper right')
 
     fig.autofmt_xdate()
-    plt.tight_layout()
 
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png', dpi=150, facecolor='#1a1a1a', edgecolor='none')
-    buf.seek(0)
-    plt.close(fig)
-    return buf.getvalue()
+    image = _figure_bytes(fig)
+    _return_pooled_fig(figsize, fig)
+    return image
 
 
-def generate_server_memory_chart(data: list[dict], title: str = "Memory Usage") -> Optional[bytes]:
-    """Generate memory usage time series chart."""
-    if not data:
-        return None
+def _generate_server_cpu_chart_arr(timestamps, cpu_values, title: str = "CPU Usage") -> Optional[bytes]:
+    """Generate CPU usage chart from parallel timestamp and value arrays."""
+    return _render_server_series(
+        timestamps, [(cpu_values, '#FF5722', 'CPU %')],
+        ylabel='CPU Usage (%)', title=title, threshold=80,
+    )
 
-    from datetime import datetime
 
-    timestamps = []
-    mem_values = []
-    for d in data:
-        try:
-            ts = d['timestamp']
-            if isinstance(ts, str):
-                for fmt in ["%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:00", "%Y-%m-%d"]:
-                    try:
-                        timestamps.append(datetime.strptime(ts, fmt))
-                        break
-                    except ValueError:
-                        continue
-                else:
-                    timestamps.append(datetime.fromisoformat(ts))
-            else:
-                timestamps.append(ts)
-            mem_values.append(d['mem_percent'])
-        except Exception as e:
-            logger.warning(f"Failed to parse data point: {e}")
-            continue
-
-    if not timestamps:
-        return None
+def _generate_server_memory_chart_arr(timestamps, mem_values, title: str = "Memory Usage") -> Optional[bytes]:
+    """Generate memory usage chart from parallel timestamp and value arrays."""
+    return _render_server_series(
+        timestamps, [(mem_values, '#2196F3', 'RAM %')],
+        ylabel='Memory Usage (%)', title=title, threshold=90,
+    )
 
-    plt.style.use('dark_background')
-    fig, ax = plt.subplots(figsize=(10, 6))
 
-    ax.plot(timestamps, mem_values, color='#2196F3', linewidth=2, label='RAM %')
-    ax.fill_between(timestamps, mem_values, alpha=0.3, color='#2196F3')
+def _generate_server_disk_chart_arr(timestamps, disk_values, title: str = "Disk Usage") -> Optional[bytes]:
+    """Generate disk usage chart from parallel timestamp and value arrays."""
+    return _render_server_series(
+        timestamps, [(disk_values, '#4CAF50', 'Disk %')],
+        ylabel='Disk Usage (%)', title=title, threshold=90,
+    )
 
-    # Add threshold line
-    ax.axhline(y=90, color='#F44336', linestyle='--', alpha=0.7, label='Alert (90%)')
 
-    ax.set_title(title, fontsize=14, fontweight='bold', color='white')
-    ax.set_ylabel('Memory Usage (%)', fontsize=12, color='white')
-    ax.set_ylim(0, 100)
-    ax.grid(True, linestyle='--', alpha=0.3)
-    ax.legend(loc='upper right')
+def _generate_server_combined_chart_arr(
+    timestamps, cpu_values, mem_values, disk_values, title: str = "Server Resources"
+) -> Optional[bytes]:
+    """Generate combined CPU/RAM/Disk chart from parallel arrays."""
+    return _render_server_series(
+        timestamps,
+        [(cpu_values, '#FF5722', 'CPU'), (mem_values, '#2196F3', 'RAM'), (disk_values, '#4CAF50', 'Disk')],
+        ylabel='Usage (%)', title=title, fill=False, figsize=(12, 6),
+    )
 
-    fig.autofmt_xdate()
-    plt.tight_layout()
 
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png', dpi=150, facecolor='#1a1a1a', edgecolor='none')
-    buf.seek(0)
-    plt.close(fig)
-    return buf.getvalue()
+def _generate_server_network_chart_arr(
+    timestamps, sent_bytes, recv_bytes, title: str = "Network Bandwidth"
+) -> Optional[bytes]:
+    """Generate network bandwidth chart from parallel arrays of byte counts."""
+    # Convert bytes to MB
+    sent_values = np.asarray(sent_bytes) * (1.0 / (1024 * 1024))
+    recv_values = np.asarray(recv_bytes) * (1.0 / (1024 * 1024))
+    return _render_server_series(
+        timestamps, [(recv_values, '#4CAF50', 'Received'), (sent_values, '#2196F3', 'Sent')],
+        ylabel='Traffic (MB per interval)', title=title, ylim=None,
+    )
 
 
-def generate_server_disk_chart(data: list[dict], title: str = "Disk Usage") -> Optional[bytes]:
-    """Generate disk usage time series chart."""
-    if not data:
+def generate_server_cpu_chart(data: "list[dict] | MetricsSeries", title: str = "CPU Usage") -> Optional[bytes]:
+    """Generate CPU usage time series chart."""
+    series = _as_series(data) if len(data) else None
+    if series is None:
         return None
+    return _generate_server_cpu_chart_arr(series.timestamps, series.cpu, title)
 
-    from datetime import datetime
 
-    timestamps = []
-    disk_values = []
-    for d in data:
-        try:
-            ts = d['timestamp']
-            if isinstance(ts, str):
-                for fmt in ["%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:00", "%Y-%m-%d"]:
-                    try:
-                        timestamps.append(datetime.strptime(ts, fmt))
-                        break
-                    except ValueError:
-                        continue
-                else:
-                    timestamps.append(datetime.fromisoformat(ts))
-            else:
-                timestamps.append(ts)
-            disk_values.append(d['disk_percent'])
-        except Exception as e:
-            logger.warning(f"Failed to parse data point: {e}")
-            continue
-
-    if not timestamps:
+def generate_server_memory_chart(data: "list[dict] | MetricsSeries", title: str = "Memory Usage") -> Optional[bytes]:
+    """Generate memory usage time series chart."""
+    series = _as_series(data) if len(data) else None
+    if series is None:
         return None
+    return _generate_server_memory_chart_arr(series.timestamps, series.mem, title)
 
-    plt.style.use('dark_background')
-    fig, ax = plt.subplots(figsize=(10, 6))
 
-    ax.plot(timestamps, disk_values, color='#4CAF50', linewidth=2, label='Disk %')
-    ax.fill_between(timestamps, disk_values, alpha=0.3, color='#4CAF50')
-
-    # Add threshold line
-    ax.axhline(y=90, color='#F44336', linestyle='--', alpha=0.7, label='Alert (90%)')
-
-    ax.set_title(title, fontsize=14, fontweight='bold', color='white')
-    ax.set_ylabel('Disk Usage (%)', fontsize=12, color='white')
-    ax.set_ylim(0, 100)
-    ax.grid(True, linestyle='--', alpha=0.3)
-    ax.legend(loc='upper right')
-
-    fig.autofmt_xdate()
-    plt.tight_layout()
-
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png', dpi=150, facecolor='#1a1a1a', edgecolor='none')
-    buf.seek(0)
-    plt.close(fig)
-    return buf.getvalue()
-
-
-def generate_server_combined_chart(data: list[dict], title: str = "Server Resources") -> Optional[bytes]:
-    """Generate combined chart with CPU, RAM, Disk."""
-    if not data:
+def generate_server_disk_chart(data: "list[dict] | MetricsSeries", title: str = "Disk Usage") -> Optional[bytes]:
+    """Generate disk usage time series chart."""
+    series = _as_series(data) if len(data) else None
+    if series is None:
         return None
+    return _generate_server_disk_chart_arr(series.timestamps, series.disk, title)
 
-    from datetime import datetime
 
-    timestamps = []
-    cpu_values = []
-    mem_values = []
-    disk_values = []
-
-    for d in data:
-        try:
-            ts = d['timestamp']
-            if isinstance(ts, str):
-                for fmt in ["%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:00", "%Y-%m-%d"]:
-                    try:
-                        timestamps.append(datetime.strptime(ts, fmt))
-                        break
-                    except ValueError:
-                        continue
-                else:
-                    timestamps.append(datetime.fromisoformat(ts))
-            else:
-                timestamps.append(ts)
-            cpu_values.append(d['cpu_percent'])
-            mem_values.append(d['mem_percent'])
-            disk_values.append(d['disk_percent'])
-        except Exception as e:
-            logger.warning(f"Failed to parse data point: {e}")
-            continue
-
-    if not timestamps:
+def generate_server_combined_chart(data: "list[dict] | MetricsSeries", title: str = "Server Resources") -> Optional[bytes]:
+    """Generate combined chart with CPU, RAM, Disk."""
+    series = _as_series(data) if len(data) else None
+    if series is None:
         return None
+    return _generate_server_combined_chart_arr(series.timestamps, series.cpu, series.mem, series.disk, title)
 
-    plt.style.use('dark_background')
-    fig, ax = plt.subplots(figsize=(12, 6))
-
-    ax.plot(timestamps, cpu_values, color='#FF5722', linewidth=2, label='CPU')
-    ax.plot(timestamps, mem_values, color='#2196F3', linewidth=2, label='RAM')
-    ax.plot(timestamps, disk_values, color='#4CAF50', linewidth=2, label='Disk')
-
-    ax.set_title(title, fontsize=14, fontweight='bold', color='white')
-    ax.set_ylabel('Usage (%)', fontsize=12, color='white')
-    ax.set_ylim(0, 100)
-    ax.grid(True, linestyle='--', alpha=0.3)
-    ax.legend(loc='upper right')
 
-    fig.autofmt_xdate()
-    plt.tight_layout()
-
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png', dpi=150, facecolor='#1a1a1a', edgecolor='none')
-    buf.seek(0)
-    plt.close(fig)
-    return buf.getvalue()
-
-
-def generate_server_network_chart(data: list[dict], title: str = "Network Bandwidth") -> Optional[bytes]:
+def generate_server_network_chart(data: "list[dict] | MetricsSeries", title: str = "Network Bandwidth") -> Optional[bytes]:
     """Generate network bandwidth time series chart."""
-    if not data:
-        return None
-
-    from datetime import datetime
-
-    timestamps = []
-    sent_values = []
-    recv_values = []
-
-    for d in data:
-        try:
-            ts = d['timestamp']
-            if isinstance(ts, str):
-                for fmt in ["%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:00", "%Y-%m-%d"]:
-                    try:
-                        timestamps.append(datetime.strptime(ts, fmt))
-                        break
-                    except ValueError:
-                        continue
-                else:
-                    timestamps.append(datetime.fromisoformat(ts))
-            else:
-                timestamps.append(ts)
-            # Convert bytes to MB
-            sent_values.append(d['net_bytes_sent'] / (1024 * 1024))
-            recv_values.append(d['net_bytes_recv'] / (1024 * 1024))
-        except Exception as e:
-            logger.warning(f"Failed to parse data point: {e}")
-            continue
-
-    if not timestamps:
+    series = _as_series(data) if len(data) else None
+    if series is None:
         return None
-
-    plt.style.use('dark_background')
-    fig, ax = plt.subplots(figsize=(10, 6))
-
-    ax.plot(timestamps, recv_values, color='#4CAF50', linewidth=2, label='Received')
-    ax.plot(timestamps, sent_values, color='#2196F3', linewidth=2, label='Sent')
-    ax.fill_between(timestamps, recv_values, alpha=0.3, color='#4CAF50')
-    ax.fill_between(timestamps, sent_values, alpha=0.3, color='#2196F3')
-
-    ax.set_title(title, fontsize=14, fontweight='bold', color='white')
-    ax.set_ylabel('Traffic (MB per interval)', fontsize=12, color='white')
-    ax.grid(True, linestyle='--', alpha=0.3)
-    ax.legend(loc='upper right')
-
-    fig.autofmt_xdate()
-    plt.tight_layout()
-
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png', dpi=150, facecolor='#1a1a1a', edgecolor='none')
-    buf.seek(0)
-    plt.close(fig)
-    return buf.getvalue()
+    return _generate_server_network_chart_arr(series.timestamps, series.net_sent, series.net_recv, title)
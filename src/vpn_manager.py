@@ -4,13 +4,25 @@ Handles key generation, config creation, and interface management.
 """
 
 import asyncio
+import base64
 import os
 import logging
+import tempfile
+from contextlib import aclosing
 from dataclasses import dataclass
+from functools import cache
 from typing import Optional
 
+try:
+    from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey
+except ImportError:  # optional, falls back to the awg CLI
+    X25519PrivateKey = None
+
 logger = logging.getLogger(__name__)
 
+# awg/awg-quick processes a VPNManager runs at once
+MAX_CONCURRENT_COMMANDS = 2
+
 # AmneziaWG obfuscation parameters
 # These are defaults that can be overridden via environment variables
 DEFAULT_AWG_PARAMS = {
@@ -26,8 +38,12 @@ DEFAULT_AWG_PARAMS = {
 }
 
 
+@cache
 def get_awg_params() -> dict[str, int]:
-    """Get AWG obfuscation parameters from env or defaults."""
+    """
+    Get AWG obfuscation parameters from env or defaults.
+    Read once per process; treat the returned dict as read-only.
+    """
     params = {}
     for key, default in DEFAULT_AWG_PARAMS.items():
         env_value = os.getenv(f"AWG_{key}")
@@ -42,6 +58,60 @@ def get_awg_params() -> dict[str, int]:
     return params
 
 
+# Config skeletons formatted with str.format; AWG params are passed as **params
+_CLIENT_CONFIG_TEMPLATE = """[Interface]
+PrivateKey = {private_key}
+Address = {address}
+DNS = {dns}
+Jc = {Jc}
+Jmin = {Jmin}
+Jmax = {Jmax}
+S1 = {S1}
+S2 = {S2}
+H1 = {H1}
+H2 = {H2}
+H3 = {H3}
+H4 = {H4}
+
+[Peer]
+PublicKey = {server_public_key}
+Endpoint = {vpn_host}:{vpn_port}
+AllowedIPs = 0.0.0.0/0, ::/0
+PersistentKeepalive = 25
+"""
+
+_SERVER_INTERFACE_TEMPLATE = """[Interface]
+PrivateKey = {server_private_key}
+Address = 10.8.0.1/24
+ListenPort = {vpn_port}
+PostUp = iptables -A FORWARD -i %i -j ACCEPT; iptables -t nat -A POSTROUTING -o eth0 -j MASQUERADE
+PostDown = iptables -D FORWARD -i %i -j ACCEPT; iptables -t nat -D POSTROUTING -o eth0 -j MASQUERADE
+Jc = {Jc}
+Jmin = {Jmin}
+Jmax = {Jmax}
+S1 = {S1}
+S2 = {S2}
+H1 = {H1}
+H2 = {H2}
+H3 = {H3}
+H4 = {H4}
+"""
+
+_PEER_TEMPLATE = """
+[Peer]
+PublicKey = {public_key}
+AllowedIPs = {address}
+"""
+
+
+def _write_temp_config(text: str) -> str:
+    """Write text to a new mode-600 temp file and return its path."""
+    fd, path = tempfile.mkstemp(prefix="awg_", suffix=".conf")
+    with os.fdopen(fd, "w") as f:
+        f.write(text)
+    return path
+
+
 @dataclass
 class KeyPair:
     """WireGuard key pair."""
@@ -49,6 +119,19 @@ class KeyPair:
     public_key: str
 
 
+def _generate_keypair_native() -> KeyPair:
+    """Generate a Curve25519 key pair in-process, same format as 'awg genkey | awg pubkey'."""
+    raw = bytearray(os.urandom(32))
+    # Clamp the scalar the way 'wg genkey' does
+    raw[0] &= 248
+    raw[31] = (raw[31] & 127) | 64
+    key = X25519PrivateKey.from_private_bytes(bytes(raw))
+    return KeyPair(
+        private_key=base64.b64encode(raw).decode(),
+        public_key=base64.b64encode(key.public_key().public_bytes_raw()).decode(),
+    )
+
+
 @dataclass
 class TrafficStats:
     """Traffic statistics for a peer."""
@@ -79,20 +162,55 @@ class VPNManager:
         self.vpn_port = vpn_port
         self.dns = dns
         self.awg_params = get_awg_params()
+        # Caps concurrent awg/awg-quick processes; bursts of stats polls and
+        # peer changes otherwise contend on the interface's netlink lock
+        self._cmd_sem = asyncio.Semaphore(MAX_CONCURRENT_COMMANDS)
 
     async def _run_command(self, *args: str) -> tuple[str, str, int]:
         """Run a shell command and return stdout, stderr, returncode."""
         logger.debug(f"Running command: {' '.join(args)}")
-        proc = await asyncio.create_subprocess_exec(
-            *args,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        stdout, stderr = await proc.communicate()
+        async with self._cmd_sem:
+            proc = await asyncio.create_subprocess_exec(
+                *args,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+            stdout, stderr = await proc.communicate()
         return stdout.decode().strip(), stderr.decode().strip(), proc.returncode
 
+    async def _run_lines(self, *args: str):
+        """
+        Run a command and yield its stdout lines as they are produced.
+        Raises RuntimeError with stderr if the command exits non-zero.
+        Holds a command slot until exhausted or closed, so callers must wrap
+        it in contextlib.aclosing() to free it when they stop early.
+        """
+        logger.debug(f"Running command: {' '.join(args)}")
+        async with self._cmd_sem:
+            proc = await asyncio.create_subprocess_exec(
+                *args,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+            # Drain stderr concurrently so a chatty command can't block on it
+            stderr_task = asyncio.create_task(proc.stderr.read())
+            try:
+                async for line in proc.stdout:
+                    yield line.decode().rstrip("\n")
+                await proc.wait()
+            finally:
+                if proc.returncode is None:
+                    proc.kill()
+                    await proc.wait()
+                stderr = (await stderr_task).decode().strip()
+        if proc.returncode != 0:
+            raise RuntimeError(stderr)
+
     async def generate_keypair(self) -> KeyPair:
-        """Generate a new WireGuard key pair using awg."""
+        """Generate a new WireGuard key pair, in-process if possible, else using awg."""
+        if X25519PrivateKey is not None:
+            return _generate_keypair_native()
+
         # Generate private key
         stdout, stderr, code = await self._run_command("awg", "genkey")
         if code != 0:
@@ -100,13 +218,14 @@ class VPNManager:
         private_key = stdout
 
         # Derive public key
-        proc = await asyncio.create_subprocess_exec(
-            "awg", "pubkey",
-            stdin=asyncio.subprocess.PIPE,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        stdout_bytes, stderr_bytes = await proc.communicate(private_key.encode())
+        async with self._cmd_sem:
+            proc = await asyncio.create_subprocess_exec(
+                "awg", "pubkey",
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+            stdout_bytes, stderr_bytes = await proc.communicate(private_key.encode())
         if proc.returncode != 0:
             raise RuntimeError(f"Failed to derive public key: {stderr_bytes.decode()}")
         public_key = stdout_bytes.decode().strip()
@@ -119,58 +238,29 @@ class VPNManager:
         client_address: str,
     ) -> str:
         """Generate client configuration file content."""
-        params = self.awg_params
-        config = f"""[Interface]
-PrivateKey = {client_private_key}
-Address = {client_address}
-DNS = {self.dns}
-Jc = {params['Jc']}
-Jmin = {params['Jmin']}
-Jmax = {params['Jmax']}
-S1 = {params['S1']}
-S2 = {params['S2']}
-H1 = {params['H1']}
-H2 = {params['H2']}
-H3 = {params['H3']}
-H4 = {params['H4']}
-
-[Peer]
-PublicKey = {self.server_public_key}
-Endpoint = {self.vpn_host}:{self.vpn_port}
-AllowedIPs = 0.0.0.0/0, ::/0
-PersistentKeepalive = 25
-"""
-        return config
+        return _CLIENT_CONFIG_TEMPLATE.format(
+            private_key=client_private_key,
+            address=client_address,
+            dns=self.dns,
+            server_public_key=self.server_public_key,
+            vpn_host=self.vpn_host,
+            vpn_port=self.vpn_port,
+            **self.awg_params,
+        )
 
     def generate_server_config(self, clients: list[dict]) -> str:
         """
         Generate server configuration file content.
         clients: list of dicts with 'public_key' and 'address' keys
         """
-        params = self.awg_params
-        config = f"""[Interface]
-PrivateKey = {self.server_private_key}
-Address = 10.8.0.1/24
-ListenPort = {self.vpn_port}
-PostUp = iptables -A FORWARD -i %i -j ACCEPT; iptables -t nat -A POSTROUTING -o eth0 -j MASQUERADE
-PostDown = iptables -D FORWARD -i %i -j ACCEPT; iptables -t nat -D POSTROUTING -o eth0 -j MASQUERADE
-Jc = {params['Jc']}
-Jmin = {params['Jmin']}
-Jmax = {params['Jmax']}
-S1 = {params['S1']}
-S2 = {params['S2']}
-H1 = {params['H1']}
-H2 = {params['H2']}
-H3 = {params['H3']}
-H4 = {params['H4']}
-"""
-        for client in clients:
-            config += f"""
-[Peer]
-PublicKey = {client['public_key']}
-AllowedIPs = {client['address']}
-"""
-        return config
+        config = _SERVER_INTERFACE_TEMPLATE.format(
+            server_private_key=self.server_private_key,
+            vpn_port=self.vpn_port,
+            **self.awg_params,
+        )
+        parts = [config]
+        parts.extend(_PEER_TEMPLATE.format(**client) for client in clients)
+        return "".join(parts)
 
     async def add_peer(self, public_key: str, allowed_ips: str) -> bool:
         """Add a peer to the running interface (hot-add, no restart)."""
@@ -206,42 +296,34 @@ AllowedIPs = {client['address']}
         Get traffic statistics for all peers.
         Parses output of 'awg show <interface> dump'.
         """
-        stdout, stderr, code = await self._run_command(
-            "awg", "show", self.interface, "dump"
-        )
-        if code != 0:
-            logger.error(f"Failed to get stats: {stderr}")
-            return []
-
-        stats = []
-        lines = stdout.split("\n")
-
         # First line is interface info, skip it
         # Format: private_key public_key listen_port fwmark
         # Peer lines: public_key preshared_key endpoint allowed_ips latest_handshake rx tx
-
-        for line in lines[1:]:  # Skip first line (interface info)
-            if not line.strip():
-                continue
-
-            parts = line.split("\t")
-            if len(parts) >= 7:
-                public_key = parts[0]
-                # preshared_key = parts[1]  # Usually "(none)"
-                endpoint = parts[2] if parts[2] != "(none)" else None
-                allowed_ips = parts[3]
-                latest_handshake = int(parts[4]) if parts[4] != "0" else 0
-                bytes_received = int(parts[5])
-                bytes_sent = int(parts[6])
-
-                stats.append(TrafficStats(
-                    public_key=public_key,
-                    endpoint=endpoint,
-                    allowed_ips=allowed_ips,
-                    latest_handshake=latest_handshake,
-                    bytes_received=bytes_received,
-                    bytes_sent=bytes_sent,
-                ))
+        # Peers are parsed as awg writes them rather than after it exits
+        stats = []
+        try:
+            async with aclosing(self._run_lines("awg", "show", self.interface, "dump")) as lines:
+                first = True
+                async for line in lines:
+                    if first:
+                        first = False
+                        continue
+                    parts = line.split("\t")
+                    if len(parts) < 7:
+                        continue
+                    endpoint = parts[2]
+                    stats.append(TrafficStats(
+                        public_key=parts[0],
+                        # parts[1] is the preshared key, usually "(none)"
+                        endpoint=endpoint if endpoint != "(none)" else None,
+                        allowed_ips=parts[3],
+                        latest_handshake=int(parts[4]),
+                        bytes_received=int(parts[5]),
+                        bytes_sent=int(parts[6]),
+                    ))
+        except RuntimeError as e:
+            logger.error(f"Failed to get stats: {e}")
+            return []
 
         return stats
 
@@ -263,15 +345,16 @@ AllowedIPs = {client['address']}
             logger.error(f"Failed to strip config: {stderr}")
             return False
 
-        # Write stripped config to temp file
-        temp_config = "/tmp/awg_stripped.conf"
-        with open(temp_config, "w") as f:
-            f.write(stdout)
+        # Write stripped config to a private temp file (unique per call)
+        temp_config = await asyncio.to_thread(_write_temp_config, stdout)
 
         # Sync with running interface
-        _, stderr, code = await self._run_command(
-            "awg", "syncconf", self.interface, temp_config
-        )
+        try:
+            _, stderr, code = await self._run_command(
+                "awg", "syncconf", self.interface, temp_config
+            )
+        finally:
+            os.unlink(temp_config)
         if code != 0:
             logger.error(f"Failed to sync config: {stderr}")
             return False
@@ -315,21 +398,10 @@ AllowedIPs = {client['address']}
         try:
             with open(config_path, 'w') as f:
                 f.writelines(interface_lines)
-                for client in clients:
-                    f.write("\n[Peer]\n")
-                    f.write(f"PublicKey = {client['public_key']}\n")
-                    f.write(f"AllowedIPs = {client['address']}\n")
+                f.write("".join(_PEER_TEMPLATE.format(**client) for client in clients))
             
             # Set secure permissions: 600 (read/write only by owner)
             os.chmod(config_path, 0o600)
             logger.info(f"Updated config file with {len(clients)} peers and set secure permissions (600)")
         except Exception as e:
             logger.exception(f"Failed to write config file: {e}")
-
-def format_bytes(bytes_count: int) -> str:
-    """Format bytes to human-readable string."""
-    for unit in ["B", "KB", "MB", "GB", "TB"]:
-        if bytes_count < 1024:
-            return f"{bytes_count:.2f} {unit}"
-        bytes_count /= 1024
-    return f"{bytes_count:.2f} PB"